@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+
+# Приоритеты очереди ожидания: меньше - важнее
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонен контролем допуска"""
+
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Token bucket для ограничения частоты запросов одного клиента"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now=None):
+        """Забирает токен; возвращает 0 при успехе или время ожидания в секундах"""
+        self._refill(now or time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionLease:
+    """Занятый слот; повторное освобождение безопасно"""
+
+    def __init__(self, controller, started):
+        self.controller = controller
+        self.started = started
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self.started)
+
+
+class AdmissionController:
+    """
+    Контроль допуска к LLM: per-client rate limit, глобальный лимит
+    одновременных запросов и ограниченная приоритетная очередь ожидания
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=32, queue_timeout=10.0,
+                 rate_per_minute=20, burst=5, max_buckets=10000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_buckets = max_buckets
+
+        self._buckets = {}
+        self._in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wait_times = deque(maxlen=1000)
+        self._avg_hold = 5.0
+        self._counters = {
+            "admitted": 0,
+            "rejected_rate_limit": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "shed": 0,
+        }
+
+    def _take_token(self, key):
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full(now)}
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.try_take(now)
+
+    def _estimate_wait(self):
+        """Грубая оценка времени до освобождения слота для Retry-After"""
+        queued = len(self._waiters) + 1
+        return self._avg_hold * queued / self.max_concurrent
+
+    def check_rate(self, key):
+        """Списывает токен клиента или выбрасывает AdmissionRejected 429"""
+        retry_after = self._take_token(key)
+        if retry_after:
+            self._counters["rejected_rate_limit"] += 1
+            raise AdmissionRejected(429, "Слишком много запросов, попробуйте позже", retry_after)
+
+    async def acquire(self, key, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Ожидает слот или выбрасывает AdmissionRejected; возвращает AdmissionLease.
+        timeout ограничивает ожидание сверх queue_timeout (остаток дедлайна запроса).
+        key=None - rate limit уже проверен через check_rate
+        """
+        if key is not None:
+            self.check_rate(key)
+
+        started = time.monotonic()
+        if self._in_flight < self.max_concurrent and not self._waiters:
+            self._in_flight += 1
+            self._admitted(0.0)
+            return AdmissionLease(self, started)
+
+        if len(self._waiters) >= self.max_queue:
+            # Вытесняем самого неприоритетного ожидающего, если новый запрос важнее
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                self._counters["rejected_queue_full"] += 1
+                raise AdmissionRejected(503, "Сервис перегружен, попробуйте позже", self._estimate_wait())
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            worst[2].set_exception(
+                AdmissionRejected(503, "Сервис перегружен, попробуйте позже", self._estimate_wait())
+            )
+            self._counters["shed"] += 1
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            wait = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+            await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.exception():
+                # Слот передали в момент таймаута - возвращаем его
+                self.release(started)
+            else:
+                self._remove_waiter(entry)
+            self._counters["rejected_timeout"] += 1
+            raise AdmissionRejected(503, "Сервис перегружен, попробуйте позже", self._estimate_wait())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and not future.exception():
+                self.release(started)
+            else:
+                self._remove_waiter(entry)
+            raise
+
+        admitted = time.monotonic()
+        self._admitted(admitted - started)
+        return AdmissionLease(self, admitted)
+
+    def _remove_waiter(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        if not entry[2].done():
+            entry[2].cancel()
+
+    def _admitted(self, waited):
+        self._counters["admitted"] += 1
+        self._wait_times.append(waited)
+
+    def release(self, started=None):
+        """Освобождает слот и передает его следующему ожидающему"""
+        if started is not None:
+            held = time.monotonic() - started
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self._in_flight -= 1
+
+    def metrics(self):
+        waits = sorted(self._wait_times)
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "wait_p50_s": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95_s": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max_s": waits[-1] if waits else 0.0,
+            **self._counters,
+        }
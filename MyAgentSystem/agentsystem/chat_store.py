@@ -0,0 +1,296 @@
+import asyncio
+import os
+import secrets
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, Integer, String, Text, DateTime, ForeignKey, Index, Boolean,
+    select, update, insert, or_, and_, event
+)
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+
+DATABASE_URL = os.getenv("CHAT_DATABASE_URL", "sqlite+aiosqlite:///./database_data/chat.db")
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True)
+    email = Column(String(255), unique=True, nullable=False)
+    fio = Column(String(255), nullable=False, default="")
+    work_group = Column(String(255), nullable=False, default="")
+    password_hash = Column(String(255), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_login = Column(DateTime)
+    is_active = Column(Boolean, nullable=False, default=True)
+
+
+class UserSession(Base):
+    __tablename__ = "sessions"
+
+    token = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Chat(Base):
+    __tablename__ = "chats"
+    __table_args__ = (Index("ix_chats_user_updated", "user_id", "updated_at"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    title = Column(String(255), nullable=False, default="Новый чат")
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    is_active = Column(Boolean, nullable=False, default=True)
+
+
+class Message(Base):
+    __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_chat_created", "chat_id", "created_at", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
+    by = Column(String(16), nullable=False)
+    message = Column(Text, nullable=False)
+    classification = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+def create_engine(url=DATABASE_URL):
+    """Создает async движок с пулом соединений"""
+    if url.startswith("sqlite"):
+        path = url.split("///", 1)[-1]
+        if path and path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        engine = create_async_engine(url, connect_args={"timeout": 30})
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=int(os.getenv("CHAT_DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("CHAT_DB_MAX_OVERFLOW", "20")),
+        pool_pre_ping=True
+    )
+
+
+class ChatStore:
+    """Хранилище пользователей, чатов и сообщений"""
+
+    def __init__(self, url=DATABASE_URL):
+        self.engine = create_engine(url)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def create_tables(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def close(self):
+        await self.engine.dispose()
+
+    # Пользователи
+
+    async def get_user_by_email(self, email):
+        async with self.sessionmaker() as session:
+            result = await session.execute(select(User).where(User.email == email))
+            return result.scalar_one_or_none()
+
+    async def create_user(self, email, password_hash, fio="", work_group=""):
+        async with self.sessionmaker() as session:
+            user = User(email=email, password_hash=password_hash, fio=fio,
+                        work_group=work_group, last_login=datetime.utcnow())
+            session.add(user)
+            await session.commit()
+            return user
+
+    async def create_session(self, user_id):
+        token = secrets.token_urlsafe(32)
+        async with self.sessionmaker() as session:
+            session.add(UserSession(token=token, user_id=user_id))
+            await session.execute(
+                update(User).where(User.id == user_id).values(last_login=datetime.utcnow())
+            )
+            await session.commit()
+        return token
+
+    async def get_user_by_token(self, token):
+        async with self.sessionmaker() as session:
+            result = await session.execute(
+                select(User).join(UserSession, UserSession.user_id == User.id)
+                .where(UserSession.token == token, User.is_active.is_(True))
+            )
+            return result.scalar_one_or_none()
+
+    # Чаты
+
+    async def create_chat(self, user_id, title="Новый чат"):
+        async with self.sessionmaker() as session:
+            chat = Chat(user_id=user_id, title=title)
+            session.add(chat)
+            await session.commit()
+            return chat
+
+    async def list_chats(self, user_id):
+        async with self.sessionmaker() as session:
+            result = await session.execute(
+                select(Chat)
+                .where(Chat.user_id == user_id, Chat.is_active.is_(True))
+                .order_by(Chat.updated_at.desc())
+            )
+            return result.scalars().all()
+
+    async def get_chat(self, user_id, chat_id):
+        async with self.sessionmaker() as session:
+            result = await session.execute(
+                select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id, Chat.is_active.is_(True))
+            )
+            return result.scalar_one_or_none()
+
+    async def delete_chat(self, user_id, chat_id):
+        async with self.sessionmaker() as session:
+            result = await session.execute(
+                update(Chat)
+                .where(Chat.id == chat_id, Chat.user_id == user_id, Chat.is_active.is_(True))
+                .values(is_active=False)
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    # Сообщения
+
+    async def add_messages(self, rows):
+        """Вставляет пачку сообщений одной транзакцией (executemany)"""
+        if not rows:
+            return
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault("created_at", now)
+        touched = {}
+        for row in rows:
+            touched[row["chat_id"]] = max(touched.get(row["chat_id"], row["created_at"]), row["created_at"])
+
+        async with self.sessionmaker() as session:
+            await session.execute(insert(Message), rows)
+            for chat_id, updated_at in touched.items():
+                await session.execute(
+                    update(Chat).where(Chat.id == chat_id).values(updated_at=updated_at)
+                )
+            await session.commit()
+
+    async def get_messages(self, chat_id, limit=50, before=None):
+        """
+        Keyset пагинация истории: возвращает до limit сообщений старше курсора
+        before=(created_at, id) в хронологическом порядке и курсор следующей страницы
+        """
+        query = select(Message).where(Message.chat_id == chat_id)
+        if before is not None:
+            created_at, message_id = before
+            query = query.where(or_(
+                Message.created_at < created_at,
+                and_(Message.created_at == created_at, Message.id < message_id)
+            ))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+
+        async with self.sessionmaker() as session:
+            result = await session.execute(query)
+            messages = result.scalars().all()
+
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            last = messages[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return list(reversed(messages)), next_cursor
+
+
+def encode_cursor(created_at, message_id):
+    return f"{created_at.isoformat()}_{message_id}"
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор пагинации; ValueError при неверном формате"""
+    created_at, message_id = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(created_at), int(message_id)
+
+
+class MessageWriter:
+    """
+    Write-behind запись сообщений: потоковые ответы кладутся в очередь,
+    фоновая задача сбрасывает их пачками, не задерживая отдачу токенов
+    """
+
+    def __init__(self, store, batch_size=100, flush_interval=0.5, max_pending=10000):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.task = None
+        self.dropped = 0
+        self.written = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.task = asyncio.create_task(self._run())
+
+    def enqueue(self, chat_id, by, message, classification=None):
+        """Ставит сообщение в очередь на запись (вызывать из event loop)"""
+        row = {"chat_id": chat_id, "by": by, "message": message,
+               "classification": classification, "created_at": datetime.utcnow()}
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"⚠️ Очередь записи сообщений переполнена, сообщение чата {chat_id} отброшено")
+
+    def enqueue_threadsafe(self, chat_id, by, message, classification=None):
+        """То же, что enqueue, но из рабочего потока"""
+        self._loop.call_soon_threadsafe(self.enqueue, chat_id, by, message, classification)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            row = await self.queue.get()
+            if row is None:
+                break
+            rows = [row]
+            deadline = self._loop.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+            await self._flush(rows)
+
+    async def _flush(self, rows):
+        try:
+            await self.store.add_messages(rows)
+            self.written += len(rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            print(f"❌ Ошибка записи {len(rows)} сообщений: {e}")
+
+    async def stop(self):
+        """Дописывает остаток очереди и останавливает фоновую задачу"""
+        if self.task is not None:
+            await self.queue.put(None)
+            await self.task
+            self.task = None
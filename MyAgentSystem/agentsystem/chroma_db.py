@@ -1,38 +1,110 @@
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
+import chromadb
+import hashlib
 import os
+from datetime import datetime
 
-def create_vectorstore(documents, persist_directory="./chroma_db"):
-    """Создает векторное хранилище"""
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    )
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class EmbeddingBackendMismatch(ValueError):
+    """Коллекция построена другим бэкендом эмбеддингов, чем настроен сейчас"""
+
+
+def embedding_backend():
+    return os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+def embedding_metadata():
+    """Метаданные коллекции: каким бэкендом и моделью посчитаны векторы"""
+    return {"embedding_backend": embedding_backend(), "embedding_model": EMBEDDING_MODEL}
+
+
+def check_embedding_backend(name, metadata):
+    """
+    Отказывает в загрузке коллекции, посчитанной другим бэкендом: векторы
+    onnx-int8 расходятся с torch, и поиск молча деградирует
+    """
+    metadata = metadata or {}
+    built_with = metadata.get("embedding_backend")
+    if built_with is None:
+        print(f"⚠️ Коллекция {name} построена до учета бэкенда эмбеддингов; "
+              f"пересоберите ее, если EMBEDDING_BACKEND менялся")
+        return
+    if built_with != embedding_backend() or metadata.get("embedding_model", EMBEDDING_MODEL) != EMBEDDING_MODEL:
+        raise EmbeddingBackendMismatch(
+            f"Коллекция {name} построена бэкендом {built_with} ({metadata.get('embedding_model')}), "
+            f"а настроен {embedding_backend()} ({EMBEDDING_MODEL}): пересоберите базу init_vector_db.py"
+        )
+
+
+def get_embeddings(backend=None):
+    """Возвращает модель эмбеддингов: torch (по умолчанию), onnx или onnx-int8"""
+    if backend is None:
+        backend = embedding_backend()
+
+    if backend in ("onnx", "onnx-int8"):
+        from agentsystem.onnx_embeddings import OnnxEmbeddings
+
+        threads = os.getenv("EMBEDDING_THREADS")
+        return OnnxEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            quantize=backend == "onnx-int8",
+            intra_op_threads=int(threads) if threads else None
+        )
+
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+def create_vectorstore(documents, persist_directory="./chroma_db", embeddings=None, version=None):
+    """
+    Создает векторное хранилище. С version коллекция создается рядом
+    с текущей, не трогая ее
+    """
+    if embeddings is None:
+        embeddings = get_embeddings()
     
     vectorstore = Chroma.from_documents(
         documents=documents,
         embedding=embeddings,
-        persist_directory=persist_directory
+        persist_directory=persist_directory,
+        collection_name=collection_name(version),
+        collection_metadata={"version": version or "", **embedding_metadata()}
     )
     
     return vectorstore
 
-def load_existing_vectorstore(persist_directory="./chroma_db"):
-    """Загружает существующую векторную базу данных"""
+def load_existing_vectorstore(persist_directory="./chroma_db", embeddings=None, version=None):
+    """
+    Загружает коллекцию версии version (по умолчанию текущей);
+    None, если такой коллекции нет
+    """
     try:
         
         if not os.path.exists(persist_directory):
             return None
+
+        if version is None:
+            version = get_current_version(persist_directory)
+        client = chromadb.PersistentClient(path=persist_directory)
+        name = collection_name(version)
+        if name not in _collection_names(client):
+            return None
             
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-        )
+        if embeddings is None:
+            embeddings = get_embeddings()
         
         vectorstore = Chroma(
-            persist_directory=persist_directory,
+            client=client,
+            collection_name=name,
             embedding_function=embeddings
         )
+        if vectorstore._collection.count():
+            check_embedding_backend(name, vectorstore._collection.metadata)
         
         return vectorstore
+    except EmbeddingBackendMismatch:
+        raise
     except Exception as e:
         print(f"❌ Ошибка при загрузке векторной базы данных: {e}")
         return None
@@ -49,3 +121,167 @@ def add_documents_to_vectorstore(vectorstore, documents):
     except Exception as e:
         print(f"❌ Ошибка при добавлении документов: {e}")
         return False
+
+COLLECTION_NAME = "langchain"
+PARTITION_PREFIX = "kb_"
+CURRENT_VERSION_FILE = "CURRENT_VERSION"
+
+
+def new_version():
+    """Имя новой версии базы знаний: время сборки, сортируется по возрастанию"""
+    return datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+
+
+def collection_name(version=None):
+    """Имя единой коллекции; без версии - коллекция langchain по умолчанию"""
+    return f"{COLLECTION_NAME}_{version}" if version else COLLECTION_NAME
+
+
+def _collection_names(client):
+    return [collection if isinstance(collection, str) else collection.name
+            for collection in client.list_collections()]
+
+
+def _single_collections(client):
+    """Версии единой коллекции: список (имя, version); version "" - без версии"""
+    result = []
+    for name in _collection_names(client):
+        if name == COLLECTION_NAME:
+            result.append((name, ""))
+        elif name.startswith(COLLECTION_NAME + "_"):
+            result.append((name, name[len(COLLECTION_NAME) + 1:]))
+    return result
+
+
+def partition_name(section, version=None):
+    """Имя коллекции раздела: Chroma допускает только латиницу, поэтому хэш"""
+    name = PARTITION_PREFIX + hashlib.sha1(section.encode("utf-8")).hexdigest()[:12]
+    return f"{name}_v{version}" if version else name
+
+
+def _partition_collections(client):
+    """Коллекции разделов: список (имя, section, version); version "" - без версии"""
+    result = []
+    for name in _collection_names(client):
+        if not name.startswith(PARTITION_PREFIX):
+            continue
+        metadata = client.get_collection(name).metadata or {}
+        result.append((name, metadata.get("section", name), metadata.get("version", "")))
+    return result
+
+
+def get_current_version(persist_directory="./chroma_db"):
+    """Версия базы знаний, которую нужно обслуживать; "" - база без версий"""
+    try:
+        with open(os.path.join(persist_directory, CURRENT_VERSION_FILE), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def set_current_version(persist_directory, version):
+    """Атомарно переключает указатель текущей версии"""
+    path = os.path.join(persist_directory, CURRENT_VERSION_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+
+def list_partition_versions(persist_directory="./chroma_db"):
+    if not os.path.exists(persist_directory):
+        return []
+    client = chromadb.PersistentClient(path=persist_directory)
+    # Коллекции без версии (созданные до версионирования) идут первыми
+    return sorted({version for _, _, version in _partition_collections(client)}, key=lambda v: v or "")
+
+
+def delete_partition_version(persist_directory, version):
+    """Удаляет коллекции разделов указанной версии"""
+    client = chromadb.PersistentClient(path=persist_directory)
+    for name, _, collection_version in _partition_collections(client):
+        if collection_version == version:
+            client.delete_collection(name)
+
+
+def list_versions(persist_directory="./chroma_db"):
+    """Версии единой коллекции"""
+    if not os.path.exists(persist_directory):
+        return []
+    client = chromadb.PersistentClient(path=persist_directory)
+    return sorted(version for _, version in _single_collections(client))
+
+
+def delete_version(persist_directory, version):
+    """Удаляет единую коллекцию указанной версии"""
+    client = chromadb.PersistentClient(path=persist_directory)
+    for name, collection_version in _single_collections(client):
+        if collection_version == version:
+            client.delete_collection(name)
+
+
+def create_partitioned_vectorstores(documents, persist_directory="./chroma_db", embeddings=None, version=None):
+    """
+    Создает отдельную коллекцию на каждый раздел (section) базы знаний.
+    С version коллекции создаются рядом с текущими, не трогая их
+    """
+    if embeddings is None:
+        embeddings = get_embeddings()
+    client = chromadb.PersistentClient(path=persist_directory)
+
+    # Пересоздаем разделы этой версии с нуля, чтобы удаленные из базы знаний не остались
+    for name, _, collection_version in _partition_collections(client):
+        if collection_version == (version or ""):
+            client.delete_collection(name)
+
+    groups = {}
+    for document in documents:
+        groups.setdefault(document.metadata.get("section", "Общее"), []).append(document)
+
+    partitions = {}
+    for section, section_documents in groups.items():
+        vectorstore = Chroma(
+            client=client,
+            collection_name=partition_name(section, version),
+            embedding_function=embeddings,
+            collection_metadata={"section": section, "version": version or "", **embedding_metadata()}
+        )
+        vectorstore.add_documents(section_documents)
+        partitions[section] = vectorstore
+
+    return partitions
+
+
+def load_partitioned_vectorstores(persist_directory="./chroma_db", embeddings=None, version=None):
+    """
+    Загружает коллекции разделов версии version (по умолчанию текущей);
+    None, если база не разбита на разделы
+    """
+    try:
+        if not os.path.exists(persist_directory):
+            return None
+
+        if version is None:
+            version = get_current_version(persist_directory)
+        client = chromadb.PersistentClient(path=persist_directory)
+        collections = [(name, section) for name, section, collection_version in _partition_collections(client)
+                       if collection_version == version]
+        if not collections:
+            return None
+
+        if embeddings is None:
+            embeddings = get_embeddings()
+        partitions = {}
+        for name, section in collections:
+            check_embedding_backend(name, client.get_collection(name).metadata)
+            partitions[section] = Chroma(
+                client=client,
+                collection_name=name,
+                embedding_function=embeddings
+            )
+        return partitions
+    except EmbeddingBackendMismatch:
+        raise
+    except Exception as e:
+        print(f"❌ Ошибка при загрузке разделов векторной базы данных: {e}")
+        return None
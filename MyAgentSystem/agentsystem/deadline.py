@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class RequestCancelled(Exception):
+    """Запрос отменен: клиент отключился или истек дедлайн"""
+
+
+class RequestContext:
+    """
+    Дедлайн и флаг отмены запроса, общие для event loop и рабочего потока,
+    в котором идут поиск и генерация
+    """
+
+    def __init__(self, timeout):
+        self.deadline = time.monotonic() + timeout
+        self._cancelled = threading.Event()
+        self.reason = None
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason="client_disconnected"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        """Отменен ли запрос; истекший дедлайн тоже считается отменой"""
+        if not self._cancelled.is_set() and time.monotonic() >= self.deadline:
+            self.cancel("deadline_exceeded")
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled(self.reason)
+
+
+class StreamMetrics:
+    """Счетчики потоковых ответов: завершенные, отмененные и сэкономленная генерация"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._avg_answer_chars = None
+        self.counters = {
+            "completed": 0,
+            "client_disconnected": 0,
+            "deadline_exceeded": 0,
+            "errors": 0,
+            "chunks_delivered": 0,
+            "chunks_wasted": 0,
+            "chars_delivered": 0,
+            "chars_wasted": 0,
+            "chars_saved_estimate": 0,
+        }
+
+    def record(self, outcome, delivered_chars, delivered_chunks, wasted_chars=0, wasted_chunks=0):
+        """
+        outcome: completed, client_disconnected, deadline_exceeded или errors.
+        wasted - получено от LLM после отмены и не отправлено клиенту
+        """
+        with self._lock:
+            self.counters[outcome] += 1
+            self.counters["chunks_delivered"] += delivered_chunks
+            self.counters["chars_delivered"] += delivered_chars
+            self.counters["chunks_wasted"] += wasted_chunks
+            self.counters["chars_wasted"] += wasted_chars
+
+            if outcome == "completed":
+                if self._avg_answer_chars is None:
+                    self._avg_answer_chars = float(delivered_chars)
+                else:
+                    self._avg_answer_chars = 0.95 * self._avg_answer_chars + 0.05 * delivered_chars
+            elif outcome in ("client_disconnected", "deadline_exceeded") and self._avg_answer_chars:
+                # Оценка недогенерированного хвоста по средней длине полного ответа
+                saved = self._avg_answer_chars - delivered_chars - wasted_chars
+                self.counters["chars_saved_estimate"] += int(max(0.0, saved))
+
+    def metrics(self):
+        with self._lock:
+            return {**self.counters, "avg_answer_chars": self._avg_answer_chars or 0.0}
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+import numpy as np
+
+FAQ_INDEX_PATH = "./faq_index"
+TICKETS_URL = "./data/Обращения.txt"
+
+
+def load_tickets(path=TICKETS_URL):
+    """Загружает обращения из лога, по одному на строку"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def ticket_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        return matrix / max(np.linalg.norm(matrix), 1e-12)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def kmeans_plus_plus(vectors, k, rng, weights=None):
+    """
+    Инициализация k-means++: новые центры выбираются далеко от уже выбранных.
+    weights - число повторов каждой точки
+    """
+    n = len(vectors)
+    if weights is None:
+        weights = np.ones(n, dtype=np.float32)
+    chosen = [int(rng.choice(n, p=weights / weights.sum()))]
+    distance = 1 - vectors @ vectors[chosen[0]]
+    for _ in range(1, k):
+        probs = weights * np.clip(distance, 0, None) ** 2
+        total = probs.sum()
+        index = int(rng.choice(n, p=probs / total)) if total > 0 else int(rng.integers(n))
+        chosen.append(index)
+        distance = np.minimum(distance, 1 - vectors @ vectors[index])
+    return vectors[chosen].copy()
+
+
+def minibatch_kmeans(vectors, k, batch_size=256, iterations=100, seed=0, weights=None):
+    """
+    Сферический mini-batch k-means по нормированным векторам: каждый шаг
+    сдвигает центроиды к средним своих точек из батча с темпом 1/count.
+    weights - число повторов каждой точки: частые обращения тянут центроид сильнее
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = min(k, n)
+    if weights is None:
+        weights = np.ones(n, dtype=np.float32)
+    weights = np.asarray(weights, dtype=np.float32)
+    centroids = kmeans_plus_plus(vectors, k, rng, weights)
+    counts = np.zeros(k, dtype=np.float32)
+
+    for _ in range(iterations):
+        batch_idx = rng.choice(n, min(batch_size, n), replace=False)
+        batch, batch_weights = vectors[batch_idx], weights[batch_idx]
+        labels = np.argmax(batch @ centroids.T, axis=1)
+
+        batch_counts = np.bincount(labels, weights=batch_weights, minlength=k).astype(np.float32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch * batch_weights[:, None])
+
+        counts += batch_counts
+        moved = batch_counts > 0
+        centroids[moved] += (sums[moved] - batch_counts[moved, None] * centroids[moved]) / counts[moved, None]
+        centroids = normalize(centroids)
+
+    labels = np.argmax(vectors @ centroids.T, axis=1)
+    return centroids, labels
+
+
+class FaqIndex:
+    """
+    Кластеры типовых обращений с заранее сгенерированными ответами.
+    seen - сколько повторов каждого обращения (по хэшу текста) уже учтено,
+    ticket_clusters - в какой кластер попало обращение; size кластера -
+    число обращений с повторами, а не уникальных текстов
+    """
+
+    def __init__(self, centroids=None, clusters=None, seen=None, match_threshold=0.9, ticket_clusters=None):
+        self.centroids = centroids
+        self.clusters = clusters or []
+        # Индексы до учета повторов хранили список хэшей
+        self.seen = dict.fromkeys(seen, 1) if isinstance(seen, list) else dict(seen or {})
+        self.ticket_clusters = dict(ticket_clusters or {})
+        self.match_threshold = match_threshold
+        self.hits = 0
+        self.misses = 0
+        self._refresh_answered()
+
+    def _refresh_answered(self):
+        """Для поиска оставляем только кластеры с готовым ответом"""
+        answered = [i for i, c in enumerate(self.clusters) if c.get("answer")]
+        self._answered = np.array(answered, dtype=np.int64)
+        if self.centroids is not None and answered:
+            self._answered_centroids = self.centroids[self._answered]
+        else:
+            self._answered_centroids = None
+
+    def lookup(self, question_vector):
+        """Возвращает кластер с ответом, если вопрос близок к его центроиду"""
+        if self._answered_centroids is None:
+            self.misses += 1
+            return None
+
+        scores = self._answered_centroids @ normalize(question_vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.match_threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self.clusters[self._answered[best]]
+
+    def metrics(self):
+        return {
+            "clusters": len(self.clusters),
+            "answered": len(self._answered),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def save(self, path=FAQ_INDEX_PATH):
+        """
+        Сохраняет индекс; файлы подменяются атомарно, faq.json последним -
+        по нему запущенный сервер замечает новую версию
+        """
+        os.makedirs(path, exist_ok=True)
+        centroids_path = os.path.join(path, "centroids.npy")
+        with open(f"{centroids_path}.tmp", "wb") as fh:
+            np.save(fh, self.centroids)
+        os.replace(f"{centroids_path}.tmp", centroids_path)
+
+        json_path = os.path.join(path, "faq.json")
+        with open(f"{json_path}.tmp", "w", encoding="utf-8") as fh:
+            json.dump({
+                "clusters": self.clusters,
+                "seen": dict(sorted(self.seen.items())),
+                "ticket_clusters": dict(sorted(self.ticket_clusters.items()))
+            }, fh, ensure_ascii=False, indent=2)
+        os.replace(f"{json_path}.tmp", json_path)
+
+    @classmethod
+    def load(cls, path=FAQ_INDEX_PATH, match_threshold=0.9):
+        """Загружает индекс; None, если он еще не построен"""
+        json_path = os.path.join(path, "faq.json")
+        if not os.path.exists(json_path):
+            return None
+        with open(json_path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        centroids = np.load(os.path.join(path, "centroids.npy"))
+        if data["clusters"] and len(centroids) != len(data["clusters"]):
+            raise ValueError(f"centroids.npy ({len(centroids)}) не соответствует faq.json "
+                             f"({len(data['clusters'])} кластеров): индекс еще сохраняется?")
+        return cls(centroids, data["clusters"], data["seen"], match_threshold, data.get("ticket_clusters"))
+
+
+class FaqHolder:
+    """
+    Текущий FaqIndex с перезагрузкой без рестарта сервера: по запросу
+    или при изменении faq.json (build_faq.py). Запрос берет current один раз
+    """
+
+    def __init__(self, path=FAQ_INDEX_PATH, match_threshold=0.9):
+        self.path = path
+        self.match_threshold = match_threshold
+        self.current = None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self.status = {"reloads": 0, "last_reload_at": None, "last_error": None}
+
+    def reload(self):
+        """Перечитывает индекс с диска; при ошибке остается прежний. False при ошибке"""
+        with self._lock:
+            self._mtime = _mtime(os.path.join(self.path, "faq.json"))
+            try:
+                index = FaqIndex.load(self.path, self.match_threshold)
+            except Exception as e:
+                self.status["last_error"] = str(e)
+                print(f"❌ Ошибка загрузки FAQ, остается прежний: {e}")
+                return False
+
+            old = self.current
+            if index is not None and old is not None:
+                # Счетчики попаданий продолжаются, а не обнуляются при перезагрузке
+                index.hits, index.misses = old.hits, old.misses
+            self.current = index
+            self.status["reloads"] += 1
+            self.status["last_reload_at"] = datetime.utcnow().isoformat() + "Z"
+            self.status["last_error"] = None
+            if index is not None:
+                print(f"✅ FAQ загружен: {index.metrics()}")
+            elif old is not None:
+                print("⚠️ faq.json удален: FAQ отключен")
+            return True
+
+    def _watch(self, interval):
+        json_path = os.path.join(self.path, "faq.json")
+        while not self._stop.wait(interval):
+            if _mtime(json_path) != self._mtime:
+                self.reload()
+
+    def start_watcher(self, interval=5.0):
+        """Следит за faq.json и подхватывает пересобранный FAQ"""
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True, name="faq-watcher")
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _fill_answers(index, answer_fn, min_coverage, report):
+    """
+    Генерирует ответы кластерам без ответа; ошибка одного вызова LLM
+    не теряет остальные - кластер остается без ответа до следующего запуска
+    """
+    for cluster in index.clusters:
+        if cluster.get("answer") or cluster["coverage"] < min_coverage:
+            continue
+        try:
+            cluster["answer"] = answer_fn(cluster["questions"][0])
+            report["answered"] += 1
+        except Exception as e:
+            report["failed_answers"].append({"id": cluster["id"], "error": str(e)})
+    index._refresh_answered()
+
+
+def update_faq_index(index, tickets, embeddings, kb_vectors, answer_fn,
+                     k=None, assign_threshold=0.8, min_coverage=0.5, representatives=3):
+    """
+    Инкрементально обновляет индекс: новые обращения (и новые повторы уже
+    учтенных) приписываются к своим или близким кластерам, остальные
+    кластеризуются заново с весом по числу повторов. Ответы генерируются
+    для кластеров с достаточным покрытием базой знаний, у которых ответа
+    еще нет: неудачные вызовы answer_fn повторяются при следующем запуске.
+    Возвращает (index, report)
+    """
+    if index is None:
+        index = FaqIndex()
+
+    counts = Counter()
+    texts = {}
+    for ticket in tickets:
+        key = ticket_hash(ticket)
+        counts[key] += 1
+        texts.setdefault(key, ticket)
+    # Лог обращений передается целиком: новое - то, что сверх уже учтенного
+    deltas = {key: count - index.seen.get(key, 0) for key, count in counts.items()
+              if count > index.seen.get(key, 0)}
+    report = {"new_tickets": sum(deltas.values()), "new_texts": 0, "assigned": 0,
+              "new_clusters": 0, "answered": 0, "failed_answers": [], "poor_coverage": []}
+    if not deltas:
+        _fill_answers(index, answer_fn, min_coverage, report)
+        return index, report
+
+    keys = list(deltas)
+    weights = np.array([deltas[key] for key in keys], dtype=np.float32)
+    vectors = normalize(embeddings.embed_documents([texts[key] for key in keys]))
+    cluster_of = np.array([index.ticket_clusters.get(key, -1) for key in keys], dtype=np.int64)
+    report["new_texts"] = int((cluster_of < 0).sum())
+
+    if index.centroids is not None and len(index.clusters):
+        unknown = np.flatnonzero(cluster_of < 0)
+        if len(unknown):
+            scores = vectors[unknown] @ index.centroids.T
+            nearest = np.argmax(scores, axis=1)
+            close = scores[np.arange(len(unknown)), nearest] >= assign_threshold
+            cluster_of[unknown[close]] = nearest[close]
+
+        # Сдвигаем центроиды к новым точкам с учетом размера кластера и повторов
+        known = cluster_of >= 0
+        sizes = np.array([c["size"] for c in index.clusters], dtype=np.float32)
+        sums = index.centroids * sizes[:, None]
+        np.add.at(sums, cluster_of[known], vectors[known] * weights[known, None])
+        sizes += np.bincount(cluster_of[known], weights=weights[known], minlength=len(sizes))
+        index.centroids = normalize(sums)
+        for cluster, size in zip(index.clusters, sizes):
+            cluster["size"] = int(size)
+
+        report["assigned"] = int(weights[known].sum())
+
+    unassigned = np.flatnonzero(cluster_of < 0)
+    if len(unassigned):
+        points, point_weights = vectors[unassigned], weights[unassigned]
+        n_clusters = k or max(1, len(points) // 4)
+        centroids, labels = minibatch_kmeans(points, n_clusters, weights=point_weights)
+
+        new_centroids = []
+        for cluster_id in range(len(centroids)):
+            members = np.where(labels == cluster_id)[0]
+            if not len(members):
+                continue
+            centroid = normalize((points[members] * point_weights[members, None]).sum(axis=0))
+            order = members[np.argsort(-(points[members] @ centroid))]
+            questions = [texts[keys[unassigned[i]]] for i in order[:representatives]]
+            coverage = float(np.max(normalize(points[order[:1]]) @ kb_vectors.T)) if len(kb_vectors) else 0.0
+
+            cluster = {
+                "id": len(index.clusters),
+                "size": int(point_weights[members].sum()),
+                "questions": questions,
+                "coverage": coverage,
+                "answer": None
+            }
+            cluster_of[unassigned[members]] = cluster["id"]
+            index.clusters.append(cluster)
+            new_centroids.append(centroid)
+
+        stacked = np.stack(new_centroids)
+        index.centroids = stacked if index.centroids is None else np.vstack([index.centroids, stacked])
+        report["new_clusters"] = len(new_centroids)
+
+    for key, cluster_id in zip(keys, cluster_of):
+        index.seen[key] = counts[key]
+        index.ticket_clusters[key] = int(cluster_id)
+    _fill_answers(index, answer_fn, min_coverage, report)
+    # Самые частые плохо покрытые темы - первыми
+    report["poor_coverage"] = sorted(
+        (c for c in index.clusters if c["coverage"] < min_coverage),
+        key=lambda c: c["size"], reverse=True
+    )
+    return index, report
@@ -0,0 +1,278 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from agentsystem.chroma_db import (
+    create_vectorstore, load_existing_vectorstore, delete_version, list_versions, get_retriever,
+    create_partitioned_vectorstores, load_partitioned_vectorstores, delete_partition_version,
+    list_partition_versions, get_current_version, set_current_version, new_version
+)
+from agentsystem.parsers import DATA_URL, load_and_split_documents, load_and_split_sections
+from agentsystem.router import PartitionedRetriever
+
+
+class KnowledgeBaseVersion:
+    """Неизменяемый снимок базы знаний: запрос берет его один раз и работает с ним до конца"""
+
+    def __init__(self, version, retriever, chunks=0, sections=0):
+        self.version = version
+        self.retriever = retriever
+        self.chunks = chunks
+        self.sections = sections
+
+
+class KnowledgeBaseManager:
+    """
+    Горячая перезагрузка базы знаний: новая версия коллекций строится в фоне
+    рядом с текущей, проверяется и атомарно подменяет ссылку current.
+    partitioned - коллекция на каждый раздел с маршрутизацией (PartitionedRetriever),
+    иначе одна коллекция (VectorStoreRetriever).
+    Старая версия удаляется после gc_delay, когда запросы к ней гарантированно
+    завершились по дедлайну. on_version_change(version) вызывается после
+    переключения на новую версию (не при первой загрузке).
+    Сборка, в которой чанков или разделов меньше текущих более чем на
+    max_shrink, отклоняется без force: так обрезанный при сохранении файл
+    не подменит рабочую базу.
+    """
+
+    def __init__(self, embeddings, persist_directory="./chroma_db", data_url=DATA_URL,
+                 k=3, partitioned=False, max_partitions=2, gc_delay=120.0, on_version_change=None,
+                 max_shrink=0.5):
+        self.embeddings = embeddings
+        self.partitioned = partitioned
+        self.persist_directory = persist_directory
+        self.data_url = data_url
+        self.k = k
+        self.max_partitions = max_partitions
+        self.gc_delay = gc_delay
+        self.on_version_change = on_version_change
+        self.max_shrink = max_shrink
+
+        self.current = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.status = {
+            "version": None,
+            "partitioned": partitioned,
+            "reloading": False,
+            "reloads": 0,
+            "failed_reloads": 0,
+            "last_reload_at": None,
+            "last_build_s": None,
+            "last_error": None,
+        }
+
+    def _make_retriever(self, stores):
+        if self.partitioned:
+            return PartitionedRetriever(stores, self.embeddings, k=self.k, max_partitions=self.max_partitions)
+        return get_retriever(stores, k=self.k)
+
+    def _load_stores(self, version):
+        if self.partitioned:
+            return load_partitioned_vectorstores(self.persist_directory, self.embeddings, version)
+        return load_existing_vectorstore(self.persist_directory, self.embeddings, version)
+
+    def _build_stores(self, documents, version):
+        if self.partitioned:
+            return create_partitioned_vectorstores(documents, self.persist_directory, self.embeddings, version=version)
+        return create_vectorstore(documents, self.persist_directory, self.embeddings, version=version)
+
+    def _delete_version(self, version):
+        if self.partitioned:
+            delete_partition_version(self.persist_directory, version)
+        else:
+            delete_version(self.persist_directory, version)
+
+    def _search(self, retriever, vector):
+        if self.partitioned:
+            return retriever.search_by_vector(vector)
+        return retriever.vectorstore.similarity_search_by_vector(vector, **retriever.search_kwargs)
+
+    def load(self):
+        """Загружает текущую версию или строит первую"""
+        version = get_current_version(self.persist_directory)
+        stores = self._load_stores(version)
+        if stores is None:
+            print("📚 Создаем векторную базу данных...")
+            self.reload(reason="initial")
+        else:
+            self._swap(self._loaded_version(version, stores))
+        if self.current is not None:
+            self._delete_stale_versions()
+
+    def _delete_stale_versions(self):
+        """
+        Удаляет версии, оставшиеся от init_vector_db.py и прерванных перезагрузок:
+        при запуске запросов к ним еще нет
+        """
+        for version in self.versions():
+            if version != self.current.version:
+                self._delete_version(version)
+                print(f"🧹 Удалена старая версия базы знаний {version or '(без версии)'}")
+
+    def _loaded_version(self, version, stores):
+        if not self.partitioned:
+            return KnowledgeBaseVersion(version, self._make_retriever(stores), stores._collection.count())
+        chunks = sum(vectorstore._collection.count() for vectorstore in stores.values())
+        return KnowledgeBaseVersion(version, self._make_retriever(stores), chunks, len(stores))
+
+    def _swap(self, new):
+        old = self.current
+        # Присваивание ссылки атомарно: запросы видят либо старую, либо новую версию
+        self.current = new
+        self.status["version"] = new.version
+        if old is not None and old.version != new.version:
+            timer = threading.Timer(self.gc_delay, self._collect, args=(old,))
+            timer.daemon = True
+            timer.start()
+            if self.on_version_change is not None:
+                self.on_version_change(new.version)
+
+    def _collect(self, old):
+        """Удаляет версию, на которую больше не могут ссылаться запросы"""
+        if self.current is not None and self.current.version == old.version:
+            return
+        try:
+            if self.partitioned:
+                old.retriever.executor.shutdown(wait=False)
+            self._delete_version(old.version)
+            print(f"🧹 Удалена старая версия базы знаний {old.version or '(без версии)'}")
+        except Exception as e:
+            print(f"❌ Ошибка удаления версии базы знаний {old.version}: {e}")
+
+    def _check_documents(self, documents, force=False):
+        """Отклоняет пустую базу знаний и резкое сокращение относительно текущей версии"""
+        if not documents:
+            raise ValueError("База знаний пуста: нет ни одного чанка")
+        current = self.current
+        if current is None or force:
+            return
+        if len(documents) < (1 - self.max_shrink) * current.chunks:
+            raise ValueError(f"Чанков {len(documents)} вместо {current.chunks}: файл обрезан? "
+                             f"Намеренное сокращение - перезагрузка с force")
+        if not self.partitioned:
+            return
+        sections = len({doc.metadata["section"] for doc in documents})
+        if sections < (1 - self.max_shrink) * current.sections:
+            raise ValueError(f"Разделов {sections} вместо {current.sections}: файл обрезан? "
+                             f"Намеренное сокращение - перезагрузка с force")
+
+    def _validate(self, retriever, documents):
+        """Проверяет, что все разделы на месте и поиск находит сами чанки базы знаний"""
+        if self.partitioned:
+            if not retriever.sections:
+                raise ValueError("Не проиндексировано ни одного раздела")
+            expected = {doc.metadata["section"] for doc in documents}
+            missing = expected - set(retriever.sections)
+            if missing:
+                raise ValueError(f"Не проиндексированы разделы: {sorted(missing)}")
+
+        step = max(1, len(documents) // 10)
+        probes = documents[::step][:10]
+        found = 0
+        for doc in probes:
+            results = self._search(retriever, self.embeddings.embed_query(doc.page_content))
+            found += any(result.page_content == doc.page_content for result in results)
+        if found < 0.8 * len(probes):
+            raise ValueError(f"Поиск нашел только {found} из {len(probes)} проверочных чанков")
+
+    def reload(self, reason="manual", force=False):
+        """
+        Строит, проверяет и подключает новую версию; False, если перезагрузка
+        уже идет или не удалась. force пропускает проверку на сокращение базы
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        return self._reload_locked(reason, force)
+
+    def _reload_locked(self, reason, force=False):
+        """Перезагрузка под уже взятым _reload_lock; освобождает его в конце"""
+        self.status["reloading"] = True
+        version = new_version()
+        started = time.monotonic()
+        try:
+            print(f"🔄 Перезагрузка базы знаний ({reason}), версия {version}...")
+            if self.partitioned:
+                documents = load_and_split_sections(self.data_url)
+            else:
+                documents = load_and_split_documents(self.data_url)
+            self._check_documents(documents, force)
+            stores = self._build_stores(documents, version)
+            retriever = self._make_retriever(stores)
+            self._validate(retriever, documents)
+
+            set_current_version(self.persist_directory, version)
+            sections = len(stores) if self.partitioned else 0
+            self._swap(KnowledgeBaseVersion(version, retriever, len(documents), sections))
+
+            self.status["reloads"] += 1
+            self.status["last_error"] = None
+            print(f"✅ База знаний переключена на версию {version}")
+            return True
+        except Exception as e:
+            self.status["failed_reloads"] += 1
+            self.status["last_error"] = str(e)
+            print(f"❌ Ошибка перезагрузки базы знаний: {e}")
+            try:
+                self._delete_version(version)
+            except Exception:
+                pass
+            return False
+        finally:
+            self.status["reloading"] = False
+            self.status["last_reload_at"] = datetime.utcnow().isoformat() + "Z"
+            self.status["last_build_s"] = time.monotonic() - started
+            self._reload_lock.release()
+
+    def reload_in_background(self, reason="manual", force=False):
+        """Запускает перезагрузку в фоне; False, если она уже идет"""
+        # Блокировка берется до старта потока, чтобы второй вызов сразу получил отказ
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            threading.Thread(target=self._reload_locked, args=(reason, force), daemon=True, name="kb-reload").start()
+        except BaseException:
+            self._reload_lock.release()
+            raise
+        return True
+
+    def _watch(self, interval, last_mtime):
+        while not self._stop.wait(interval):
+            try:
+                mtime = _mtime(self.data_url)
+                if mtime != last_mtime:
+                    # Ждем, пока файл допишут, прежде чем индексировать
+                    time.sleep(interval)
+                    if _mtime(self.data_url) == mtime:
+                        if not self._reload_lock.acquire(blocking=False):
+                            # Идет другая перезагрузка, возможно по старому файлу:
+                            # last_mtime не сдвигаем и повторяем на следующем тике
+                            continue
+                        last_mtime = mtime
+                        self._reload_locked("file changed")
+            except Exception as e:
+                print(f"❌ Ошибка наблюдения за базой знаний: {e}")
+
+    def start_watcher(self, interval=5.0):
+        """Следит за изменением файла базы знаний"""
+        # Исходный mtime берем до старта потока, чтобы не пропустить правку сразу после запуска
+        self._watcher = threading.Thread(target=self._watch, args=(interval, _mtime(self.data_url)),
+                                         daemon=True, name="kb-watcher")
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def versions(self):
+        if self.partitioned:
+            return list_partition_versions(self.persist_directory)
+        return list_versions(self.persist_directory)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
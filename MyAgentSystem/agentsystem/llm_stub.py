@@ -0,0 +1,24 @@
+import time
+from types import SimpleNamespace
+
+
+class StubGigaChat:
+    """
+    Заглушка GigaChat для нагрузочных тестов (LLM_STUB=1): stream отдает
+    chunks фиксированных чанков с паузой delay, chat - фиксированный ответ.
+    Задержка запроса тогда определяется поиском и сервером, а не LLM
+    """
+
+    def __init__(self, chunks=40, delay=0.05):
+        self.chunks = chunks
+        self.delay = delay
+
+    def chat(self, prompt):
+        message = SimpleNamespace(content="Заглушка LLM: классификация не выполнялась")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def stream(self, prompt):
+        for i in range(self.chunks):
+            time.sleep(self.delay)
+            delta = SimpleNamespace(content=f"чанк{i} ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
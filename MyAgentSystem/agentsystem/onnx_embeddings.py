@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ONNX_MODELS_DIR = "./onnx_models"
+
+
+def available_cpus():
+    """
+    Число CPU, доступных процессу: affinity, ограниченная квотой cgroup.
+    os.cpu_count() в контейнере возвращает ядра хоста
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def export_onnx_model(model_name, output_dir, quantize=False):
+    """
+    Экспортирует модель в ONNX и при необходимости квантует веса в int8.
+    Результат пишется во временный каталог и переименовывается на место,
+    поэтому параллельный экспорт из нескольких процессов безопасен
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    if not os.path.exists(model_path):
+        print(f"🔄 Экспорт {model_name} в ONNX...")
+        parent = os.path.dirname(os.path.abspath(output_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".export-", dir=parent)
+        try:
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(tmp_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp_dir)
+            os.rename(tmp_dir, output_dir)
+            print(f"✅ ONNX модель сохранена в {output_dir}")
+        except OSError:
+            # Другой процесс успел экспортировать модель первым
+            if not os.path.exists(model_path):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if not quantize:
+        return model_path
+
+    quantized_path = os.path.join(output_dir, "model_int8.onnx")
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print("🔄 Динамическая int8 квантизация...")
+        fd, tmp_path = tempfile.mkstemp(prefix=".model_int8-", suffix=".onnx", dir=output_dir)
+        os.close(fd)
+        try:
+            quantize_dynamic(
+                model_input=model_path,
+                model_output=tmp_path,
+                weight_type=QuantType.QInt8
+            )
+            os.replace(tmp_path, quantized_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        print(f"✅ Квантованная модель сохранена в {quantized_path}")
+
+    return quantized_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Эмбеддинги sentence-transformers через onnxruntime на CPU"""
+
+    def __init__(self, model_name, quantize=False, intra_op_threads=None,
+                 batch_size=32, max_length=128, cache_dir=ONNX_MODELS_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        output_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        model_path = export_onnx_model(model_name, output_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads or available_cpus()
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(output_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _embed_batch(self, texts):
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np"
+        )
+        inputs = {name: encoded[name].astype(np.int64)
+                  for name in encoded if name in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling, как в sentence-transformers
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return summed / counts
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+
+        # Сортируем по длине, чтобы батчи паддились до близкой длины
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start:start + self.batch_size]
+            vectors = self._embed_batch([texts[i] for i in batch_idx])
+            for i, vector in zip(batch_idx, vectors):
+                result[i] = vector.tolist()
+        return result
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
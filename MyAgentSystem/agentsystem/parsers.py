@@ -2,10 +2,12 @@ from langchain_community.document_loaders import TextLoader, PyPDFLoader, Unstru
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 import os
+import re
 import markdown
 from bs4 import BeautifulSoup
 
 DATA_URL = "./data/Knowledge_base.txt"
+DEFAULT_SECTION = "Общее"
 
 def parse_pdf_documents(file_paths, chunk_size=250, chunk_overlap=100):
     """Парсит PDF файлы и разбивает на чанки"""
@@ -105,6 +107,42 @@ def load_and_split_documents(data_url=None, chunk_size=250, chunk_overlap=100):
     splits = text_splitter.split_documents(documents)
     return splits
 
+def split_by_sections(documents):
+    """Разбивает документы базы знаний на разделы по заголовкам второго уровня"""
+    sections = []
+    for document in documents:
+        parts = re.split(r"^## +(.+)$", document.page_content, flags=re.MULTILINE)
+        # parts: [текст до первого раздела, заголовок, текст, заголовок, текст, ...]
+        if parts[0].strip():
+            sections.append(Document(
+                page_content=parts[0].strip(),
+                metadata={**document.metadata, "section": DEFAULT_SECTION}
+            ))
+        for title, text in zip(parts[1::2], parts[2::2]):
+            section = re.sub(r"^\d+\.\s*", "", title).strip()
+            sections.append(Document(
+                page_content=f"{section}\n{text.strip()}",
+                metadata={**document.metadata, "section": section}
+            ))
+    return sections
+
+def load_and_split_sections(data_url=None, chunk_size=250, chunk_overlap=100):
+    """Загружает базу знаний и разбивает на чанки внутри разделов, с метаданными section"""
+    if data_url is None:
+        data_url = DATA_URL
+
+    loader = TextLoader(data_url, encoding='utf-8')
+    sections = split_by_sections(loader.load())
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+    splits = text_splitter.split_documents(sections)
+    return splits
+
 def load_multiple_documents(file_paths, chunk_size=250, chunk_overlap=100):
     """Загружает и разбивает несколько документов на чанки"""
     all_documents = []
@@ -0,0 +1,198 @@
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+_END = object()
+
+
+class SamplingProfiler:
+    """
+    Семплирующий CPU профайлер: периодически снимает стеки всех потоков
+    и копит их в folded формате (совместим с flamegraph.pl и speedscope)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    def _folded_stack(self, thread_name, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ";".join(reversed(stack))
+
+    def profile(self, duration, interval=0.005):
+        """Блокирующе снимает профиль duration секунд; возвращает folded стеки"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже запущено")
+
+        self.running = True
+        counts = Counter()
+        own_id = threading.get_ident()
+        try:
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    counts[self._folded_stack(names.get(thread_id, str(thread_id)), frame)] += 1
+                time.sleep(interval)
+        finally:
+            self.running = False
+            self._lock.release()
+
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+class MemoryTracer:
+    """
+    Трассировка аллокаций через tracemalloc: включается только на время
+    сессии, фазы запроса (retrieval, generation) снимают снимки до и после.
+    Снимки общие для процесса: в diff фазы попадают и аллокации других
+    потоков за то же время, поэтому фазы держатся короткими
+    """
+
+    def __init__(self, max_captures_per_phase=20):
+        self.enabled = False
+        self.max_captures_per_phase = max_captures_per_phase
+        self._session_lock = threading.Lock()
+        self._phase_lock = threading.Lock()
+        self._phases = {}
+
+    def start(self, frames=25):
+        if not self._session_lock.acquire(blocking=False):
+            raise RuntimeError("Трассировка памяти уже запущена")
+        self._phases = {}
+        tracemalloc.start(frames)
+        self._baseline = tracemalloc.take_snapshot()
+        self.enabled = True
+
+    def stop(self, top=30):
+        """Останавливает трассировку и возвращает отчет по фазам и общий diff"""
+        try:
+            self.enabled = False
+            # Дожидаемся фазы, которая могла начаться до выключения; фазы
+            # короткие, но зависший upstream не должен держать остановку
+            locked = self._phase_lock.acquire(timeout=5.0)
+            try:
+                final = tracemalloc.take_snapshot()
+            finally:
+                if locked:
+                    self._phase_lock.release()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            return {
+                "traced_current_bytes": current,
+                "traced_peak_bytes": peak,
+                "total_diff": _format_diff(final.compare_to(self._baseline, "traceback"), top),
+                "phases": {
+                    name: {
+                        "captures": phase["captures"],
+                        "top": _format_diff(phase["stats"].values(), top)
+                    }
+                    for name, phase in self._phases.items()
+                }
+            }
+        finally:
+            self._session_lock.release()
+
+    def phase(self, name):
+        """Снимает diff аллокаций внутри блока; без трассировки ничего не делает"""
+        if not self.enabled:
+            return _DISABLED
+        return self._capture(name)
+
+    def iterate(self, name, iterable):
+        """
+        Итерация, в которой фазой считается получение каждого элемента.
+        Блокировка снимков не держится через yield, поэтому долгий поток
+        не блокирует фазы других запросов и остановку трассировки
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    @contextmanager
+    def _capture(self, name):
+        phase = self._phases.setdefault(name, {"captures": 0, "stats": {}})
+        if phase["captures"] >= self.max_captures_per_phase or not self._phase_lock.acquire(blocking=False):
+            # Снимки глобальны для процесса, поэтому фазы пишутся по одной
+            yield
+            return
+
+        before = _snapshot()
+        if before is None:
+            # Трассировку остановили, пока фаза ждала блокировку
+            self._phase_lock.release()
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            try:
+                after = _snapshot()
+                if after is not None:
+                    phase["captures"] += 1
+                    _accumulate(phase["stats"], after.compare_to(before, "traceback"))
+            finally:
+                self._phase_lock.release()
+
+
+def _snapshot():
+    """
+    Снимок или None, если трассировка остановлена: stop() может выключить
+    ее между проверкой и снимком, а профилирование не должно ронять запрос
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    try:
+        return tracemalloc.take_snapshot()
+    except RuntimeError:
+        return None
+
+
+def _accumulate(acc, diff):
+    for stat in diff:
+        key = stat.traceback
+        if key in acc:
+            prev = acc[key]
+            acc[key] = _MergedStat(key, prev.size_diff + stat.size_diff, prev.count_diff + stat.count_diff)
+        else:
+            acc[key] = _MergedStat(key, stat.size_diff, stat.count_diff)
+
+
+class _MergedStat:
+    def __init__(self, traceback, size_diff, count_diff):
+        self.traceback = traceback
+        self.size_diff = size_diff
+        self.count_diff = count_diff
+
+
+def _format_diff(stats, top):
+    stats = sorted(stats, key=lambda s: abs(s.size_diff), reverse=True)[:top]
+    return [
+        {
+            "size_diff_bytes": stat.size_diff,
+            "count_diff": stat.count_diff,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        }
+        for stat in stats
+    ]
+
+
+cpu_profiler = SamplingProfiler()
+memory_tracer = MemoryTracer()
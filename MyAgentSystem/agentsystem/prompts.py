@@ -0,0 +1,16 @@
+def build_answer_prompt(question, docs_content):
+    """Промпт ответа на вопрос пользователя по найденным фрагментам базы знаний"""
+    return f"""
+            Ты - помощник IT-поддержки. Отвечай на основе базы знаний:  {docs_content}.
+
+
+
+Вопрос: {question}
+
+
+
+
+ТРЕБОВАНИЯ:
+Если в {question} есть, что-то про смену пароля ТОЛЬКО В ЭТОМ СЛАЧАЕ ДОБАВЬ В КОНЦЕ ОТВЕТА БЕЗ ЛИШНЕГО ТЕКСТА <ChangePassword /> ИНАЧЕ ИГНОРИРУЙ ЭТО ТРЕБОВАНИЕ И НИЧЕГО НЕ ДОБАВЛЯЙ ПРОСТО ОТВЕТ НА ВОПРОС НИЧЕГО НЕ УПОМИНАЯ ПРО смену пароля
+Если в {question} есть, что-то про вызов поддержки ТОЛЬКО В ЭТОМ СЛАЧАЕ ДОБАВЬ В КОНЦЕ ОТВЕТА БЕЗ ЛИШНЕГО ТЕКСТА <TechSupport /> ИНАЧЕ ИГНОРИРУЙ ЭТО ТРЕБОВАНИЕ И НИЧЕГО НЕ ДОБАВЛЯЙ ПРОСТО ОТВЕТ НА ВОПРОС НИЧЕГО НЕ УПОМИНАЯ ПРО вызов поддержки
+            """
@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import numpy as np
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        return matrix / max(np.linalg.norm(matrix), 1e-12)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def compute_centroids(vectors_by_section):
+    """Нормированные центроиды разделов; пустые разделы пропускаются"""
+    centroids = {}
+    for section, vectors in vectors_by_section.items():
+        if vectors is not None and len(vectors):
+            centroids[section] = _normalize(vectors).mean(axis=0)
+    return list(centroids), _normalize(list(centroids.values()))
+
+
+def route_sections(sections, centroids, query_vector, max_partitions=2, margin=0.05):
+    """Разделы, чьи центроиды ближе всего к запросу: не больше max_partitions и в пределах margin от лучшего"""
+    if not sections:
+        return []
+    scores = centroids @ _normalize(query_vector)
+    order = np.argsort(-scores)[:max_partitions]
+    best = scores[order[0]]
+    return [sections[i] for i in order if scores[i] >= best - margin]
+
+
+class PartitionedRetriever:
+    """
+    Ретривер по коллекциям разделов базы знаний: запрос сравнивается с
+    центроидами разделов, поиск идет параллельно только в ближайших разделах,
+    результаты сливаются по расстоянию
+    """
+
+    def __init__(self, partitions, embeddings, k=3, max_partitions=2, margin=0.05):
+        self.partitions = partitions
+        self.embeddings = embeddings
+        self.k = k
+        self.max_partitions = max_partitions
+        self.margin = margin
+
+        # Пустые разделы не участвуют в маршрутизации
+        self.sections, self.centroids = compute_centroids({
+            section: vectorstore.get(include=["embeddings"])["embeddings"]
+            for section, vectorstore in partitions.items()
+        })
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(len(self.sections), 8)),
+                                           thread_name_prefix="kb-partition")
+
+    def route(self, query_vector):
+        """Выбирает разделы, чьи центроиды ближе всего к запросу"""
+        return route_sections(self.sections, self.centroids, query_vector,
+                              self.max_partitions, self.margin)
+
+    def _search(self, section, query_vector):
+        # langchain_chroma возвращает здесь расстояние: меньше - ближе
+        return self.partitions[section].similarity_search_by_vector_with_relevance_scores(
+            query_vector, k=self.k
+        )
+
+    def search_by_vector(self, query_vector, timeout=None):
+        """
+        Поиск в выбранных разделах; при timeout берутся разделы, успевшие ответить,
+        а если не успел ни один - TimeoutError
+        """
+        sections = self.route(query_vector)
+        if not sections:
+            return []
+        if len(sections) == 1 and timeout is None:
+            results = self._search(sections[0], query_vector)
+        else:
+            futures = [self.executor.submit(self._search, section, query_vector) for section in sections]
+            done, not_done = wait(futures, timeout=timeout)
+            for future in not_done:
+                future.cancel()
+            if not done:
+                raise TimeoutError("Поиск по базе знаний не уложился в дедлайн")
+            results = [item for future in done for item in future.result()]
+        results.sort(key=lambda item: item[1])
+        return [document for document, _ in results[:self.k]]
+
+    def invoke(self, question):
+        """Совместим с VectorStoreRetriever.invoke"""
+        return self.search_by_vector(self.embeddings.embed_query(question))
+
+
+def build_retriever(embeddings=None, k=3):
+    """
+    Загружает (или создает) векторную базу и возвращает (retriever, embeddings):
+    одной коллекцией, либо по разделам с маршрутизацией при KB_PARTITIONED=1
+    """
+    from agentsystem.chroma_db import (
+        get_embeddings, get_retriever, load_existing_vectorstore, create_vectorstore,
+        load_partitioned_vectorstores, create_partitioned_vectorstores, new_version, set_current_version
+    )
+    from agentsystem.parsers import load_and_split_documents, load_and_split_sections
+
+    if os.getenv("KB_PARTITIONED", "0") != "1":
+        vectorstore = load_existing_vectorstore(embeddings=embeddings)
+        if vectorstore is None:
+            print("📚 Создаем новую векторную базу данных...")
+            version = new_version()
+            vectorstore = create_vectorstore(load_and_split_documents(), embeddings=embeddings, version=version)
+            set_current_version("./chroma_db", version)
+        return get_retriever(vectorstore, k=k), vectorstore.embeddings
+
+    if embeddings is None:
+        embeddings = get_embeddings()
+    partitions = load_partitioned_vectorstores(embeddings=embeddings)
+    if partitions is None:
+        print("📚 Создаем векторную базу данных по разделам...")
+        version = new_version()
+        partitions = create_partitioned_vectorstores(load_and_split_sections(), embeddings=embeddings, version=version)
+        set_current_version("./chroma_db", version)
+
+    retriever = PartitionedRetriever(
+        partitions, embeddings, k=k,
+        max_partitions=int(os.getenv("KB_MAX_PARTITIONS", "2"))
+    )
+    return retriever, embeddings
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилища чатов на локальном SQLite:
+пропускная способность вставки сообщений и задержка выборки истории
+"""
+import asyncio, os, json, random, statistics, tempfile, time
+
+from agentsystem.chat_store import ChatStore, MessageWriter, decode_cursor
+
+chats_count = 50
+messages_per_chat = 400
+single_inserts = 500
+history_fetches = 500
+page_size = 50
+out_dir = "./data/chat_store_benchmark_results"
+os.makedirs(out_dir, exist_ok=True)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def main():
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    store = ChatStore(f"sqlite+aiosqlite:///{db_path}")
+    await store.create_tables()
+
+    user = await store.create_user("bench@example.com", "x")
+    chat_ids = [(await store.create_chat(user.id, f"Чат {i}")).id for i in range(chats_count)]
+    text = "Ответ ассистента " * 20
+
+    print(f"Вставка по одному сообщению ({single_inserts})...")
+    t0 = time.perf_counter()
+    for i in range(single_inserts):
+        await store.add_messages([{"chat_id": chat_ids[i % chats_count], "by": "agent", "message": text}])
+    single_s = time.perf_counter() - t0
+    print(f"    ✅ {single_inserts / single_s:.0f} сообщений/с")
+
+    total = chats_count * messages_per_chat
+    print(f"Write-behind вставка ({total})...")
+    writer = MessageWriter(store, batch_size=200, flush_interval=0.05, max_pending=total + 1)
+    writer.start()
+    t0 = time.perf_counter()
+    for i in range(total):
+        writer.enqueue(chat_ids[i % chats_count], "user" if i % 2 else "agent", text)
+    enqueue_s = time.perf_counter() - t0
+    await writer.stop()
+    batched_s = time.perf_counter() - t0
+    print(f"    ✅ {total / batched_s:.0f} сообщений/с, постановка в очередь: "
+          f"{enqueue_s / total * 1e6:.1f}µs на сообщение")
+
+    print(f"Выборка истории ({history_fetches} страниц по {page_size})...")
+    first_page, deep_page = [], []
+    for _ in range(history_fetches):
+        chat_id = random.choice(chat_ids)
+        t0 = time.perf_counter()
+        messages, cursor = await store.get_messages(chat_id, limit=page_size)
+        first_page.append((time.perf_counter() - t0) * 1000)
+
+        # Листаем вглубь до последней страницы
+        while cursor:
+            t0 = time.perf_counter()
+            messages, cursor = await store.get_messages(chat_id, limit=page_size, before=decode_cursor(cursor))
+            deep_page.append((time.perf_counter() - t0) * 1000)
+
+    await store.close()
+
+    report = {
+        "messages_total": total + single_inserts,
+        "single_insert_per_s": single_inserts / single_s,
+        "write_behind_insert_per_s": total / batched_s,
+        "enqueue_us": enqueue_s / total * 1e6,
+        "first_page_p50_ms": statistics.median(first_page),
+        "first_page_p95_ms": percentile(first_page, 0.95),
+        "deep_page_p50_ms": statistics.median(deep_page),
+        "deep_page_p95_ms": percentile(deep_page, 0.95),
+    }
+    with open(os.path.join(out_dir, "report.json"), "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    print("\nОтчёт:")
+    for key, value in report.items():
+        print(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Сравнение бэкендов эмбеддингов (torch / onnx / onnx-int8):
+согласованность с PyTorch моделью, пропускная способность и recall@k
+поиска с маршрутизацией по разделам (KB_PARTITIONED=1) против поиска по всей базе
+"""
+import time, os, json, statistics
+import numpy as np
+
+from agentsystem.parsers import load_and_split_documents, load_and_split_sections
+from agentsystem.chroma_db import get_embeddings
+from agentsystem.router import compute_centroids, route_sections
+
+backends = ["torch", "onnx", "onnx-int8"]
+k = 3
+query_repeats = 3
+max_partitions = int(os.getenv("KB_MAX_PARTITIONS", "2"))
+out_dir = "./data/embedding_benchmark_results"
+os.makedirs(out_dir, exist_ok=True)
+
+with open('./data/Обращения.txt', encoding='utf-8') as f:
+    queries = [line.strip() for line in f if line.strip()]
+
+chunks = [doc.page_content for doc in load_and_split_documents()]
+section_docs = load_and_split_sections()
+section_chunks = [doc.page_content for doc in section_docs]
+section_labels = np.array([doc.metadata["section"] for doc in section_docs])
+print(f"Чанков базы знаний: {len(chunks)}, по разделам: {len(section_chunks)}, запросов: {len(queries)}")
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(query_vectors, doc_vectors):
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+vectors = {}
+section_vectors = {}
+results = []
+for backend in backends:
+    print(f"\n🔄 Бэкенд: {backend}")
+    t0 = time.perf_counter()
+    embeddings = get_embeddings(backend)
+    load_s = time.perf_counter() - t0
+
+    # Прогрев
+    embeddings.embed_documents(chunks[:8])
+
+    t0 = time.perf_counter()
+    doc_vectors = normalize(embeddings.embed_documents(chunks))
+    index_s = time.perf_counter() - t0
+
+    latencies = []
+    query_vectors = []
+    for _ in range(query_repeats):
+        query_vectors = []
+        for q in queries:
+            t0 = time.perf_counter()
+            query_vectors.append(embeddings.embed_query(q))
+            latencies.append((time.perf_counter() - t0) * 1000)
+    query_vectors = normalize(query_vectors)
+    latencies.sort()
+
+    vectors[backend] = (doc_vectors, query_vectors)
+    section_vectors[backend] = normalize(embeddings.embed_documents(section_chunks))
+    results.append({
+        "backend": backend,
+        "load_s": load_s,
+        "index_s": index_s,
+        "docs_per_s": len(chunks) / index_s,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    })
+    print(f"    ✅ индексация: {index_s:.2f}s ({len(chunks) / index_s:.1f} чанков/с), "
+          f"запрос p50: {statistics.median(latencies):.1f}ms")
+
+print("\nПроверка согласованности с torch...")
+ref_docs, ref_queries = vectors["torch"]
+ref_top = top_k(ref_queries, ref_docs)
+for row in results:
+    docs, qs = vectors[row["backend"]]
+    cosines = np.concatenate([(docs * ref_docs).sum(axis=1), (qs * ref_queries).sum(axis=1)])
+    backend_top = top_k(qs, docs)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(backend_top, ref_top)])
+    row["cosine_mean"] = float(cosines.mean())
+    row["cosine_min"] = float(cosines.min())
+    row[f"recall_at_{k}"] = float(recall)
+
+print("Маршрутизация по разделам против поиска по всей базе...")
+for row in results:
+    docs, qs = section_vectors[row["backend"]], vectors[row["backend"]][1]
+    sections, centroids = compute_centroids({
+        section: docs[section_labels == section] for section in set(section_labels)
+    })
+    global_top = top_k(qs, docs)
+    recalls, searched = [], []
+    for query, expected in zip(qs, global_top):
+        # Тот же выбор разделов, что в PartitionedRetriever.route
+        routed = np.flatnonzero(np.isin(section_labels, route_sections(sections, centroids, query, max_partitions)))
+        routed_top = routed[np.argsort(-(docs[routed] @ query))[:k]]
+        recalls.append(len(set(routed_top) & set(expected)) / k)
+        searched.append(len(routed) / len(docs))
+    row[f"routed_recall_at_{k}"] = float(np.mean(recalls))
+    row["routed_full_recall_share"] = float(np.mean([r == 1.0 for r in recalls]))
+    row["routed_search_fraction"] = float(np.mean(searched))
+
+with open(os.path.join(out_dir, "report.json"), "w", encoding="utf-8") as fh:
+    json.dump(results, fh, ensure_ascii=False, indent=2)
+
+print("\nСводка:")
+for row in results:
+    print(f"  {row['backend']:>10}: {row['docs_per_s']:8.1f} чанков/с, "
+          f"p50 {row['query_p50_ms']:6.1f}ms, p95 {row['query_p95_ms']:6.1f}ms, "
+          f"cos mean {row['cosine_mean']:.4f} / min {row['cosine_min']:.4f}, "
+          f"recall@{k} {row[f'recall_at_{k}']:.3f}, "
+          f"routed recall@{k} {row[f'routed_recall_at_{k}']:.3f} "
+          f"(полный у {row['routed_full_recall_share']:.0%} запросов, "
+          f"просмотрено {row['routed_search_fraction']:.0%} базы)")
+
+print(f"\nОтчёт: {os.path.join(out_dir, 'report.json')}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест горячей перезагрузки базы знаний: параллельные запросы к
+/question/stream до, во время и после /admin/kb/reload. Проверяет, что нет
+ошибок и всплеска задержки при переключении версии.
+
+Сервер нужно запустить с окружением под тест:
+  ADMIN_TOKEN=<токен>  - админский доступ к /admin/kb/*
+  LLM_STUB=1 LLM_STUB_CHUNKS=40 LLM_STUB_DELAY=0.05 - заглушка вместо GigaChat:
+      каждый ответ - 40 чанков с паузой 0.05s, так задержка зависит от поиска
+      и переключения версии, а не от LLM, и прогон воспроизводим
+  RATE_LIMIT_PER_MINUTE=100000 RATE_LIMIT_BURST=1000 - все потоки теста идут
+      с одного IP и делят один token bucket; с лимитами по умолчанию (20/мин,
+      burst 5) почти все запросы получат 429
+  без faq_index/ - попадания в FAQ не доходят до поиска по базе знаний
+  KB_PARTITIONED=0 или 1 - режим, который измеряется
+Например:
+  ADMIN_TOKEN=secret LLM_STUB=1 RATE_LIMIT_PER_MINUTE=100000 RATE_LIMIT_BURST=1000 \
+      python chat_api_server.py
+  ADMIN_TOKEN=secret python benchmark_reload.py
+Скрипт проверяет FAQ до старта и помечает прогон невалидным при 429.
+"""
+import sys, time, os, json, statistics, threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+base_url = os.getenv("BENCHMARK_URL", "http://localhost:8000")
+admin_token = os.getenv("ADMIN_TOKEN", "")
+concurrency = 4
+duration_s = 60.0
+reload_at_s = 20.0
+out_dir = "./data/reload_benchmark_results"
+os.makedirs(out_dir, exist_ok=True)
+
+with open('./data/Обращения.txt', encoding='utf-8') as f:
+    questions = [line.strip() for line in f if line.strip()][:50]
+
+admin_headers = {"X-Admin-Token": admin_token}
+results = []
+results_lock = threading.Lock()
+reload_window = {}
+
+
+def ask(question):
+    t0 = time.perf_counter()
+    status = None
+    try:
+        r = requests.post(f"{base_url}/question/stream", json=[{"by": "user", "message": question}],
+                          timeout=(5, 120))
+        status = r.status_code
+        ok = status == 200 and "Ошибка" not in r.text and r.text.endswith("data: [DONE]\n\n")
+        error = "" if ok else f"{status}: {r.text[-200:]!r}"
+    except Exception as e:
+        ok, error = False, str(e)
+    return time.perf_counter() - t0, status, ok, error
+
+
+def worker_loop(worker, started):
+    i = worker
+    while time.perf_counter() - started < duration_s:
+        sent = time.perf_counter() - started
+        elapsed, status, ok, error = ask(questions[i % len(questions)])
+        i += concurrency
+        with results_lock:
+            results.append({"sent_s": sent, "elapsed_s": elapsed, "status": status, "success": ok, "error": error})
+
+
+def trigger_reload(started):
+    time.sleep(reload_at_s)
+    before = requests.get(f"{base_url}/admin/kb/status", headers=admin_headers).json()
+    reload_window["start_s"] = time.perf_counter() - started
+    r = requests.post(f"{base_url}/admin/kb/reload", headers=admin_headers)
+    r.raise_for_status()
+    print(f"🔄 Перезагрузка запущена на {reload_window['start_s']:.1f}s, версия {before.get('version')}")
+    while True:
+        status = requests.get(f"{base_url}/admin/kb/status", headers=admin_headers).json()
+        if not status["reloading"] and status.get("last_reload_at") != before.get("last_reload_at"):
+            break
+        time.sleep(0.2)
+    reload_window["end_s"] = time.perf_counter() - started
+    reload_window["version"] = status["version"]
+    reload_window["error"] = status["last_error"]
+    print(f"✅ Переключено на версию {status['version']} за "
+          f"{reload_window['end_s'] - reload_window['start_s']:.1f}s, ошибка: {status['last_error']}")
+
+
+def summary(rows):
+    times = sorted(r["elapsed_s"] for r in rows if r["success"])
+    return {
+        "requests": len(rows),
+        "failures": sum(1 for r in rows if not r["success"]),
+        "rate_limited": sum(1 for r in rows if r["status"] == 429),
+        "p50_s": statistics.median(times) if times else None,
+        "p95_s": times[int(len(times) * 0.95) - 1] if len(times) >= 20 else (times[-1] if times else None),
+        "max_s": times[-1] if times else None,
+    }
+
+
+status = requests.get(f"{base_url}/admin/kb/status", headers=admin_headers)
+status.raise_for_status()
+if not status.json().get("hot_reload"):
+    sys.exit("❌ База знаний на сервере не инициализирована, см. лог сервера")
+if requests.get(f"{base_url}/metrics/faq").json().get("enabled", True):
+    sys.exit("❌ На сервере загружен FAQ: попадания в него не доходят до базы знаний, уберите faq_index/")
+
+print(f"Нагрузка: {concurrency} потоков, {duration_s:.0f}s, перезагрузка на {reload_at_s:.0f}s")
+started = time.perf_counter()
+reloader = threading.Thread(target=trigger_reload, args=(started,))
+reloader.start()
+with ThreadPoolExecutor(max_workers=concurrency) as ex:
+    for w in range(concurrency):
+        ex.submit(worker_loop, w, started)
+reloader.join()
+
+# Запрос относится к фазе перезагрузки, если выполнялся во время нее
+phases = {"before": [], "during": [], "after": []}
+for r in results:
+    if r["sent_s"] + r["elapsed_s"] < reload_window["start_s"]:
+        phases["before"].append(r)
+    elif r["sent_s"] > reload_window["end_s"]:
+        phases["after"].append(r)
+    else:
+        phases["during"].append(r)
+
+rate_limited = sum(1 for r in results if r["status"] == 429)
+report = {
+    "valid": rate_limited == 0,
+    "reload": reload_window,
+    "phases": {name: summary(rows) for name, rows in phases.items()},
+    "errors": [r["error"] for r in results if not r["success"]][:20],
+}
+with open(os.path.join(out_dir, "report.json"), "w", encoding="utf-8") as fh:
+    json.dump(report, fh, ensure_ascii=False, indent=2)
+
+print("\nСводка по фазам:")
+for name, row in report["phases"].items():
+    fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+    print(f"  {name:>6}: запросов {row['requests']:4}, ошибок {row['failures']:3}, "
+          f"p50 {fmt(row['p50_s'])}s, p95 {fmt(row['p95_s'])}s, max {fmt(row['max_s'])}s")
+if rate_limited:
+    print(f"\n❗ {rate_limited} запросов получили 429: прогон невалиден, "
+          f"поднимите RATE_LIMIT_PER_MINUTE и RATE_LIMIT_BURST на сервере")
+print(f"\nОтчёт: {os.path.join(out_dir, 'report.json')}")
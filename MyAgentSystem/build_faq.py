@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Офлайн построение FAQ по логу обращений: кластеризация, генерация ответов
+для типовых вопросов и отчет о кластерах, плохо покрытых базой знаний.
+Повторный запуск обрабатывает только новые обращения.
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+from dotenv import load_dotenv
+from gigachat import GigaChat
+from agentsystem.parsers import load_and_split_documents
+from agentsystem.router import build_retriever
+from agentsystem.faq import FaqIndex, FAQ_INDEX_PATH, TICKETS_URL, load_tickets, normalize, update_faq_index
+from agentsystem.prompts import build_answer_prompt
+
+load_dotenv()
+
+
+def build_faq(tickets_path=TICKETS_URL, index_path=FAQ_INDEX_PATH, k=None, min_coverage=0.5):
+    """Обновляет FAQ индекс новыми обращениями"""
+    print("📚 Загружаем обращения и базу знаний...")
+    tickets = load_tickets(tickets_path)
+    documents = load_and_split_documents()
+    print(f"✅ Обращений: {len(tickets)}, чанков базы знаний: {len(documents)}")
+
+    retriever, embeddings = build_retriever(k=3)
+    kb_vectors = normalize(embeddings.embed_documents([doc.page_content for doc in documents]))
+
+    gigachat = GigaChat(
+        credentials=os.getenv("GIGACHAT_CREDENTIALS"),
+        verify_ssl_certs=False,
+        timeout=30,
+        model='GigaChat-Max'
+    )
+
+    def generate_answer(question):
+        docs_content = "\n\n".join([doc.page_content for doc in retriever.invoke(question)])
+        response = gigachat.chat(build_answer_prompt(question, docs_content))
+        return response.choices[0].message.content
+
+    index = FaqIndex.load(index_path)
+    print("🔄 Кластеризация и генерация ответов...")
+    index, report = update_faq_index(
+        index, tickets, embeddings, kb_vectors, generate_answer,
+        k=k, min_coverage=min_coverage
+    )
+    index.save(index_path)
+
+    print(f"✅ Новых обращений: {report['new_tickets']} (новых текстов: {report['new_texts']}), "
+          f"приписано к кластерам: {report['assigned']}, "
+          f"новых кластеров: {report['new_clusters']}, сгенерировано ответов: {report['answered']}")
+    print(f"💾 FAQ сохранен в {index_path}: {index.metrics()}")
+    if report["failed_answers"]:
+        print(f"⚠️ Не удалось сгенерировать ответы для {len(report['failed_answers'])} кластеров, "
+              f"они будут повторены при следующем запуске. Первая ошибка: {report['failed_answers'][0]['error']}")
+
+    if report["poor_coverage"]:
+        print(f"\n⚠️ Кластеры с плохим покрытием базой знаний ({len(report['poor_coverage'])}):")
+        for cluster in report["poor_coverage"][:20]:
+            print(f"  [{cluster['size']:>3}] покрытие {cluster['coverage']:.2f}: {cluster['questions'][0][:100]}")
+
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Построение FAQ по логу обращений")
+    parser.add_argument("--tickets", default=TICKETS_URL, help="Файл с обращениями, по одному на строку")
+    parser.add_argument("--k", type=int, default=None, help="Число кластеров для новых обращений")
+    parser.add_argument("--min-coverage", type=float, default=0.5, help="Минимальное покрытие базой знаний")
+    args = parser.parse_args()
+
+    try:
+        success = build_faq(args.tickets, k=args.k, min_coverage=args.min_coverage)
+    except Exception as e:
+        print(f"❌ Ошибка построения FAQ: {e}")
+        success = False
+    sys.exit(0 if success else 1)
@@ -3,52 +3,115 @@
 FastAPI сервер с системой чатов и авторизации
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, Form
+from fastapi import FastAPI, HTTPException, Depends, status, Form, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from pydantic import BaseModel
+from typing import List, Optional
+from contextlib import closing
+import asyncio
+import secrets
+import bcrypt
 
 # Импорты для RAG системы
-from agentsystem.chroma_db import load_existing_vectorstore, get_retriever
 from gigachat import GigaChat
 import os
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from agentsystem.admission import (
+    AdmissionController, AdmissionRejected, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
+from agentsystem.chat_store import ChatStore, MessageWriter, decode_cursor
+from agentsystem.profiling import cpu_profiler, memory_tracer
+from agentsystem.prompts import build_answer_prompt
+from agentsystem.faq import FaqHolder
+from agentsystem.router import PartitionedRetriever
+from agentsystem.kb_reload import KnowledgeBaseManager
+from agentsystem.llm_stub import StubGigaChat
+from agentsystem.deadline import RequestContext, RequestCancelled, StreamMetrics
 
 load_dotenv()
 
 # Глобальные переменные для предзагруженных компонентов
-global_retriever = None
 global_gigachat = None
+kb_manager = None
+global_embeddings = None
+
+# Предрассчитанный FAQ (build_faq.py); перечитывается без рестарта
+faq_holder = FaqHolder(match_threshold=float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9")))
+
+# Контроль допуска запросов к GigaChat
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "8")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+    rate_per_minute=float(os.getenv("RATE_LIMIT_PER_MINUTE", "20")),
+    burst=int(os.getenv("RATE_LIMIT_BURST", "5"))
+)
+
+# Хранилище чатов и фоновая запись сообщений
+chat_store = ChatStore()
+message_writer = MessageWriter(chat_store)
+
+# Дедлайн потокового ответа и метрики отмен
+STREAM_DEADLINE = float(os.getenv("STREAM_DEADLINE", "60"))
+stream_metrics = StreamMetrics()
+
+
+def on_kb_version_change(version):
+    """
+    FAQ продолжает работать: его ответы сгенерированы по прежней версии базы
+    знаний, пересобранный build_faq.py FAQ сервер подхватит сам
+    """
+    if faq_holder.current is not None:
+        print(f"ℹ️ База знаний переключена на версию {version}: "
+              f"обновите FAQ build_faq.py, сервер подхватит его без перезапуска")
 
 
 def initialize_database():
     """Инициализация базы данных при запуске"""
-    global global_retriever, global_gigachat
+    global global_gigachat, global_embeddings, kb_manager
 
     # Инициализируем векторную базу данных
     try:
-        from agentsystem.chroma_db import load_existing_vectorstore, get_retriever
-
-        # Загружаем существующую векторную базу данных
-        vectorstore = load_existing_vectorstore()
-        if vectorstore is None:
-            print("📚 Создаем новую векторную базу данных...")
-            from agentsystem.parsers import load_and_split_documents
-            from agentsystem.chroma_db import create_vectorstore
-
-            documents = load_and_split_documents()
-            vectorstore = create_vectorstore(documents)
-
-        # Создаем retriever
-        global_retriever = get_retriever(vectorstore, k=3)
+        from agentsystem.chroma_db import get_embeddings
+
+        # Горячая перезагрузка в обоих режимах: retriever берется из kb_manager.current
+        global_embeddings = get_embeddings()
+        kb_manager = KnowledgeBaseManager(
+            global_embeddings, k=3,
+            partitioned=os.getenv("KB_PARTITIONED", "0") == "1",
+            max_partitions=int(os.getenv("KB_MAX_PARTITIONS", "2")),
+            gc_delay=STREAM_DEADLINE + 60,
+            on_version_change=on_kb_version_change
+        )
+        kb_manager.load()
+        if os.getenv("KB_WATCH", "1") != "0":
+            kb_manager.start_watcher(float(os.getenv("KB_WATCH_INTERVAL", "5")))
         print("✅ ChromaDB векторная база данных инициализирована")
 
     except Exception as e:
         print(f"❌ Ошибка инициализации ChromaDB: {e}")
-        global_retriever = None
+        kb_manager = None
+
+    # Загружаем предрассчитанный FAQ, если он построен build_faq.py
+    faq_holder.reload()
+    if os.getenv("FAQ_WATCH", "1") != "0":
+        faq_holder.start_watcher(float(os.getenv("KB_WATCH_INTERVAL", "5")))
 
     # Инициализируем GigaChat
+    if os.getenv("LLM_STUB", "0") == "1":
+        # Для нагрузочных тестов (benchmark_reload.py) без обращений к GigaChat
+        global_gigachat = StubGigaChat(
+            chunks=int(os.getenv("LLM_STUB_CHUNKS", "40")),
+            delay=float(os.getenv("LLM_STUB_DELAY", "0.05"))
+        )
+        print("⚠️ GigaChat заменен заглушкой (LLM_STUB=1): ответы не настоящие")
+        return
+
     try:
         global_gigachat = GigaChat(
             credentials=os.getenv("GIGACHAT_CREDENTIALS"),
@@ -96,6 +159,299 @@ async def startup_event():
     """Инициализация при запуске сервера"""
     initialize_database()
 
+    await chat_store.create_tables()
+    message_writer.start()
+    print("✅ Хранилище чатов инициализировано")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Дописывает накопленные сообщения и закрывает пул соединений"""
+    if kb_manager is not None:
+        kb_manager.stop_watcher()
+    faq_holder.stop_watcher()
+    await message_writer.stop()
+    await chat_store.close()
+
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
+    fio: str = ""
+    work_group: str = ""
+
+
+class ChatCreate(BaseModel):
+    title: str = "Новый чат"
+
+
+def _password_bytes(password):
+    # bcrypt учитывает только первые 72 байта; bcrypt>=5 на длинных паролях падает
+    return password.encode("utf-8")[:72]
+
+
+def hash_password(password):
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt()).decode("ascii")
+
+
+def verify_password(password, password_hash):
+    try:
+        return bcrypt.checkpw(_password_bytes(password), password_hash.encode("ascii"))
+    except ValueError:
+        return False
+
+
+def user_to_dict(user):
+    return {
+        "id": user.id,
+        "email": user.email,
+        "fio": user.fio,
+        "work_group": user.work_group,
+        "created_at": user.created_at.isoformat(),
+        "last_login": user.last_login.isoformat() if user.last_login else None
+    }
+
+
+def chat_to_dict(chat):
+    return {
+        "id": chat.id,
+        "title": chat.title,
+        "created_at": chat.created_at.isoformat(),
+        "updated_at": chat.updated_at.isoformat()
+    }
+
+
+def message_to_dict(message):
+    return {
+        "id": message.id,
+        "by": message.by,
+        "message": message.message,
+        "classification": message.classification,
+        "created_at": message.created_at.isoformat()
+    }
+
+
+async def get_current_user(x_session_token: Optional[str] = Header(None)):
+    """Пользователь по токену сессии из заголовка X-Session-Token"""
+    user = await chat_store.get_user_by_token(x_session_token) if x_session_token else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Требуется авторизация"
+        )
+    return user
+
+
+async def get_user_chat(chat_id: int, user):
+    chat = await chat_store.get_chat(user.id, chat_id)
+    if chat is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Чат не найден"
+        )
+    return chat
+
+
+@app.post("/auth/login")
+async def login(data: LoginRequest):
+    """Вход или автоматическая регистрация по email"""
+    email = data.email.strip().lower()
+    if not email or not data.password:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email и пароль обязательны"
+        )
+
+    user = await chat_store.get_user_by_email(email)
+    if user is None:
+        password_hash = await run_in_threadpool(hash_password, data.password)
+        try:
+            user = await chat_store.create_user(email, password_hash, data.fio, data.work_group)
+        except IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Пользователь уже существует"
+            )
+    elif not await run_in_threadpool(verify_password, data.password, user.password_hash):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Неверный email или пароль"
+        )
+
+    token = await chat_store.create_session(user.id)
+    return {"token": token, "user": user_to_dict(user)}
+
+
+@app.get("/auth/me")
+async def auth_me(user=Depends(get_current_user)):
+    """Информация о текущем пользователе"""
+    return user_to_dict(user)
+
+
+@app.post("/chats")
+async def create_chat(data: ChatCreate, user=Depends(get_current_user)):
+    """Создание чата"""
+    chat = await chat_store.create_chat(user.id, data.title)
+    return chat_to_dict(chat)
+
+
+@app.get("/chats")
+async def list_chats(user=Depends(get_current_user)):
+    """Список чатов пользователя, последние обновленные первыми"""
+    chats = await chat_store.list_chats(user.id)
+    return [chat_to_dict(chat) for chat in chats]
+
+
+@app.get("/chats/{chat_id}")
+async def get_chat(chat_id: int, user=Depends(get_current_user)):
+    """Информация о чате"""
+    return chat_to_dict(await get_user_chat(chat_id, user))
+
+
+@app.delete("/chats/{chat_id}")
+async def delete_chat(chat_id: int, user=Depends(get_current_user)):
+    """Удаление чата"""
+    if not await chat_store.delete_chat(user.id, chat_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Чат не найден"
+        )
+    return {"message": "Чат удален"}
+
+
+@app.get("/chats/{chat_id}/messages")
+async def get_chat_messages(chat_id: int, limit: int = 50, before: Optional[str] = None,
+                            user=Depends(get_current_user)):
+    """История сообщений с keyset пагинацией: before - курсор next_cursor предыдущей страницы"""
+    await get_user_chat(chat_id, user)
+    try:
+        cursor = decode_cursor(before) if before else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный курсор пагинации"
+        )
+
+    messages, next_cursor = await chat_store.get_messages(chat_id, min(max(limit, 1), 200), cursor)
+    return {
+        "messages": [message_to_dict(message) for message in messages],
+        "next_cursor": next_cursor
+    }
+
+
+# Адреса reverse proxy, которым можно доверить X-Forwarded-For
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+
+def get_client_ip(request: Request):
+    """IP клиента; X-Forwarded-For учитывается только от доверенного прокси"""
+    ip = request.client.host if request.client else "unknown"
+    if ip not in TRUSTED_PROXIES:
+        return ip
+    # Идем справа налево: левые адреса цепочки клиент может подделать
+    for hop in reversed(request.headers.get("X-Forwarded-For", "").split(",")):
+        hop = hop.strip()
+        if hop and hop not in TRUSTED_PROXIES:
+            return hop
+    return ip
+
+
+async def get_client_key(request: Request, user=None):
+    """Ключ клиента для rate limit: пользователь по токену сессии или IP"""
+    if user is None:
+        token = request.headers.get("X-Session-Token")
+        user = await chat_store.get_user_by_token(token) if token else None
+    if user is not None:
+        return f"user:{user.id}"
+    return f"ip:{get_client_ip(request)}"
+
+
+def admission_error(e: AdmissionRejected):
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def check_rate_limit(request: Request, user=None):
+    """Per-client rate limit без занятия слота; при превышении 429 с Retry-After"""
+    try:
+        admission.check_rate(await get_client_key(request, user))
+    except AdmissionRejected as e:
+        raise admission_error(e)
+
+
+async def admit(request: Request, priority: int, timeout: Optional[float] = None, user=None,
+                rate_checked=False):
+    """
+    Ожидает слот у контроллера допуска или отвечает 429/503 с Retry-After;
+    rate_checked - rate limit уже проверен check_rate_limit
+    """
+    try:
+        key = None if rate_checked else await get_client_key(request, user)
+        return await admission.acquire(key, priority, timeout)
+    except AdmissionRejected as e:
+        raise admission_error(e)
+
+
+async def stream_until_disconnect(iterator, request, ctx, release_unstarted, check_interval=0.25):
+    """
+    Отдает поток, читая его в рабочем потоке. При отключении клиента или
+    дедлайне выставляет отмену: генератор прекращает чтение из LLM и
+    закрывает upstream соединение. Слот допуска освобождает сам генератор
+    после закрытия upstream; release_unstarted - если он так и не запустился
+    """
+    loop = asyncio.get_running_loop()
+    done = object()
+    finished = False
+    last_check = loop.time()
+    try:
+        while True:
+            # Ожидание в executor можно бросить при отмене, не дожидаясь чанка
+            chunk = await loop.run_in_executor(None, next, iterator, done)
+            if chunk is done:
+                finished = True
+                break
+            if loop.time() - last_check >= check_interval:
+                last_check = loop.time()
+                if await request.is_disconnected():
+                    ctx.cancel("client_disconnected")
+                    break
+            yield chunk
+    finally:
+        if not finished:
+            ctx.cancel("client_disconnected")
+            try:
+                iterator.close()
+            except ValueError:
+                # Генератор сейчас в рабочем потоке: он увидит отмену и закроется сам
+                pass
+        release_unstarted()
+
+
+def current_retriever():
+    """Retriever текущей версии базы знаний; запрос берет его один раз"""
+    if kb_manager is None or kb_manager.current is None:
+        return None
+    return kb_manager.current.retriever
+
+
+def retrieve_documents(retriever, question, question_vector=None, timeout=None):
+    """
+    Поиск по базе знаний; question_vector - уже посчитанный эмбеддинг вопроса,
+    timeout - остаток дедлайна (соблюдается при поиске по разделам)
+    """
+    if isinstance(retriever, PartitionedRetriever):
+        if question_vector is None:
+            question_vector = retriever.embeddings.embed_query(question)
+        return retriever.search_by_vector(question_vector, timeout=timeout)
+    if question_vector is None:
+        return retriever.invoke(question)
+    return retriever.vectorstore.similarity_search_by_vector(
+        question_vector, **retriever.search_kwargs
+    )
+
 
 def classify_question(question: str):
     """Классификация вопроса с использованием предзагруженного GigaChat"""
@@ -123,7 +479,7 @@ def classify_question(question: str):
 
 
 @app.post("/classify")
-async def classify_endpoint(messages: List[dict]):
+async def classify_endpoint(messages: List[dict], request: Request):
     """Классификация вопроса пользователя"""
 
     # Проверяем, что есть сообщения
@@ -144,9 +500,10 @@ async def classify_endpoint(messages: List[dict]):
             detail="Вопрос не может быть пустым"
         )
 
+    lease = await admit(request, PRIORITY_BATCH)
     try:
         # Классифицируем вопрос
-        classification = classify_question(question)
+        classification = await run_in_threadpool(classify_question, question)
 
         return {"classification": classification}
 
@@ -155,43 +512,236 @@ async def classify_endpoint(messages: List[dict]):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка классификации: {str(e)}"
         )
+    finally:
+        lease.release()
 
 
 @app.post("/question/stream")
-async def stream_question(messages: List[dict]):
+async def stream_question(messages: List[dict], request: Request, chat_id: Optional[int] = None,
+                          x_session_token: Optional[str] = Header(None)):
+    ctx = RequestContext(STREAM_DEADLINE)
+    user = None
+    if chat_id is not None:
+        # Сохраняем переписку в чат: вопрос сразу, ответ после окончания потока
+        user = await get_current_user(x_session_token)
+        await get_user_chat(chat_id, user)
+
+    # Проверяем запрос до того, как занять слот допуска
+    if not messages:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Список сообщений не может быть пустым"
+        )
+    question = messages[-1].get("message")
+    if not isinstance(question, str) or not question.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Вопрос не может быть пустым"
+        )
+
+    # Rate limit до FAQ: эмбеддинг вопроса тоже стоит CPU. На попадание в FAQ
+    # не занимается только слот одновременных запросов к GigaChat
+    await check_rate_limit(request, user)
+
+    question_vector = None
+    faq = faq_holder.current  # может быть подменен перезагрузкой FAQ
+    if faq is not None and global_embeddings is not None:
+        # Типовой вопрос отдаем готовым ответом без обращения к GigaChat
+        question_vector = await run_in_threadpool(global_embeddings.embed_query, question)
+        cluster = faq.lookup(question_vector)
+        if cluster is not None:
+            if chat_id is not None:
+                message_writer.enqueue(chat_id, "user", question)
+                message_writer.enqueue(chat_id, "agent", cluster["answer"])
+            return StreamingResponse(iter([cluster["answer"], "data: [DONE]\n\n"]),
+                                     media_type="text/event-stream")
+
+    # Версия базы знаний фиксируется на весь запрос, даже если ее переключат
+    retriever = current_retriever()
+    loop = asyncio.get_running_loop()
+    started = False
+
+    def release_unstarted():
+        # Запущенный генератор освобождает слот сам, когда закроет поток GigaChat
+        if not started:
+            lease.release()
+
     def generate_stream():
+        nonlocal started
+        started = True
+        answer_parts = []
+        wasted_parts = []
+        outcome = "completed"
         try:
+            ctx.check()
+            with memory_tracer.phase("retrieval"):
+                retrieved_docs = retrieve_documents(retriever, question, question_vector, timeout=ctx.remaining())
+            docs_content = "\n\n".join([doc.page_content for doc in retrieved_docs])
 
-            question = messages[-1]["message"]
+            prompt = build_answer_prompt(question, docs_content)
+
+            ctx.check()
+            # closing закрывает HTTP поток GigaChat при выходе из цикла
+            with closing(global_gigachat.stream(prompt)) as stream:
+                # Фаза generation - получение каждого чанка, без времени отправки клиенту
+                for chunk in memory_tracer.iterate("generation", stream):
+                    content = chunk.choices[0].delta.content
+                    if ctx.cancelled:
+                        if content:
+                            wasted_parts.append(content)
+                        raise RequestCancelled(ctx.reason)
+                    if content:
+                        answer_parts.append(content)
+                        yield f"{content}"
+
+        except GeneratorExit:
+            # Генератор закрыт из event loop после отключения клиента
+            outcome = ctx.reason or "client_disconnected"
+            raise
+        except RequestCancelled:
+            outcome = ctx.reason
+        except TimeoutError:
+            outcome = "deadline_exceeded"
+        except Exception as e:
+            outcome = "errors"
+            yield f"data: Ошибка: {str(e)}\n\n"
+        finally:
+            stream_metrics.record(
+                outcome,
+                delivered_chars=sum(len(part) for part in answer_parts),
+                delivered_chunks=len(answer_parts),
+                wasted_chars=sum(len(part) for part in wasted_parts),
+                wasted_chunks=len(wasted_parts)
+            )
+            if chat_id is not None and answer_parts:
+                message_writer.enqueue_threadsafe(chat_id, "agent", "".join(answer_parts))
+            # Слот занят, пока открыт upstream: до этой точки closing() уже закрыл
+            # поток GigaChat. Генератор идет в рабочем потоке, а контроллер
+            # допуска меняется только из event loop
+            loop.call_soon_threadsafe(lease.release)
+
+        if outcome == "deadline_exceeded":
+            yield "data: Ошибка: превышено время ожидания ответа\n\n"
+        if outcome != "client_disconnected":
+            yield "data: [DONE]\n\n"
 
-            retrieved_docs = global_retriever.invoke(question)
-            docs_content = "\n\n".join([doc.page_content for doc in retrieved_docs])
+    lease = await admit(request, PRIORITY_INTERACTIVE, timeout=ctx.remaining(), rate_checked=True)
+    try:
+        if chat_id is not None:
+            message_writer.enqueue(chat_id, "user", question)
+
+        async def release_lease():
+            # Корутина, а не lease.release: синхронную задачу Starlette выполнил бы
+            # в threadpool, а очередь контроллера меняется только из event loop.
+            # Нужна, если отключение клиента отменило ответ до первого чанка
+            release_unstarted()
+
+        return StreamingResponse(
+            stream_until_disconnect(generate_stream(), request, ctx, release_unstarted),
+            media_type="text/event-stream",
+            background=BackgroundTask(release_lease)
+        )
+    except BaseException:
+        lease.release()
+        raise
 
-            prompt = f"""
-            Ты - помощник IT-поддержки. Отвечай на основе базы знаний:  {docs_content}.
 
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Доступ к админским эндпоинтам по ADMIN_TOKEN; без него они выключены"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав"
+        )
 
 
-Вопрос: {question}
+@app.post("/admin/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(duration: float = 10.0, interval_ms: float = 5.0):
+    """Семплирующий CPU профиль всех потоков в folded формате для flamegraph"""
+    duration = min(max(duration, 0.1), 120.0)
+    interval = min(max(interval_ms, 1.0), 100.0) / 1000
+    try:
+        folded = await run_in_threadpool(cpu_profiler.profile, duration, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(folded)
 
 
+@app.post("/admin/profile/memory", dependencies=[Depends(require_admin)])
+async def profile_memory(duration: float = 30.0, top: int = 30):
+    """Трассировка аллокаций tracemalloc: diff по фазам retrieval/generation и общий"""
+    duration = min(max(duration, 0.1), 300.0)
+    try:
+        memory_tracer.start()
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        report = await run_in_threadpool(memory_tracer.stop, min(max(top, 1), 200))
+    return report
 
 
-ТРЕБОВАНИЯ:
-Если в {question} есть, что-то про смену пароля ТОЛЬКО В ЭТОМ СЛАЧАЕ ДОБАВЬ В КОНЦЕ ОТВЕТА БЕЗ ЛИШНЕГО ТЕКСТА <ChangePassword /> ИНАЧЕ ИГНОРИРУЙ ЭТО ТРЕБОВАНИЕ И НИЧЕГО НЕ ДОБАВЛЯЙ ПРОСТО ОТВЕТ НА ВОПРОС НИЧЕГО НЕ УПОМИНАЯ ПРО смену пароля
-Если в {question} есть, что-то про вызов поддержки ТОЛЬКО В ЭТОМ СЛАЧАЕ ДОБАВЬ В КОНЦЕ ОТВЕТА БЕЗ ЛИШНЕГО ТЕКСТА <TechSupport /> ИНАЧЕ ИГНОРИРУЙ ЭТО ТРЕБОВАНИЕ И НИЧЕГО НЕ ДОБАВЛЯЙ ПРОСТО ОТВЕТ НА ВОПРОС НИЧЕГО НЕ УПОМИНАЯ ПРО вызов поддержки
-            """
+@app.post("/admin/kb/reload", dependencies=[Depends(require_admin)])
+async def reload_knowledge_base(force: bool = False):
+    """
+    Запускает фоновую перестройку базы знаний с атомарным переключением;
+    force - принять сборку, заметно меньше текущей (намеренное сокращение)
+    """
+    if kb_manager is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="База знаний не инициализирована"
+        )
+    if not kb_manager.reload_in_background(reason="admin", force=force):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Перезагрузка уже выполняется"
+        )
+    return {"status": "started", "version": kb_manager.status["version"]}
 
-            for chunk in global_gigachat.stream(prompt):
-                if chunk.choices[0].delta.content:
-                    yield f"{chunk.choices[0].delta.content}"
 
-        except Exception as e:
-            yield f"data: Ошибка: {str(e)}\n\n"
-        finally:
-            yield "data: [DONE]\n\n"
+@app.get("/admin/kb/status", dependencies=[Depends(require_admin)])
+async def knowledge_base_status():
+    """Текущая версия базы знаний и результат последней перезагрузки"""
+    if kb_manager is None:
+        return {"hot_reload": False}
+    versions = await run_in_threadpool(kb_manager.versions)
+    return {"hot_reload": True, **kb_manager.status, "versions": versions}
+
+
+@app.post("/admin/faq/reload", dependencies=[Depends(require_admin)])
+async def reload_faq():
+    """Перечитывает FAQ, пересобранный build_faq.py; при ошибке остается прежний"""
+    if not await run_in_threadpool(faq_holder.reload):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"FAQ не загружен, остается прежний: {faq_holder.status['last_error']}"
+        )
+    faq = faq_holder.current
+    return {**faq_holder.status, **(faq.metrics() if faq is not None else {"enabled": False})}
+
+
+@app.get("/metrics/streams")
+async def streams_metrics():
+    """Метрики потоковых ответов: отмены по отключению клиента и дедлайну, потраченные и сэкономленные символы"""
+    return stream_metrics.metrics()
+
+
+@app.get("/metrics/faq")
+async def faq_metrics():
+    """Метрики FAQ: число кластеров с ответами, попадания и промахи"""
+    faq = faq_holder.current
+    return faq.metrics() if faq is not None else {"enabled": False}
+
 
-    return StreamingResponse(generate_stream(), media_type="text/event-stream")
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """Метрики контроля допуска: занятые слоты, глубина очереди, время ожидания"""
+    return admission.metrics()
 
 
 @app.get("/")
@@ -216,10 +766,10 @@ async def root():
                 "GET /chats": "Список чатов",
                 "GET /chats/{id}": "Информация о чате",
                 "DELETE /chats/{id}": "Удалить чат",
-                "GET /chats/{id}/messages": "История сообщений"
+                "GET /chats/{id}/messages": "История сообщений (limit, before)"
             },
             "question": {
-                "POST /question": "Отправить сообщение в чат"
+                "POST /question/stream": "Отправить сообщение (chat_id - сохранить в чат)"
             }
         }
     }
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Скрипт для инициализации базы данных чатов
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(__file__))
+
+from agentsystem.chat_store import ChatStore, DATABASE_URL
+
+
+async def init_chat_database():
+    """Создает таблицы пользователей, чатов и сообщений"""
+    print(f"🔄 Инициализация базы данных чатов: {DATABASE_URL}")
+
+    store = ChatStore()
+    try:
+        await store.create_tables()
+        print("✅ Таблицы созданы")
+    except Exception as e:
+        print(f"❌ Ошибка при инициализации: {e}")
+        return False
+    finally:
+        await store.close()
+
+    return True
+
+if __name__ == "__main__":
+    success = asyncio.run(init_chat_database())
+    sys.exit(0 if success else 1)
@@ -1,33 +1,106 @@
 #!/usr/bin/env python3
 """
 Скрипт для инициализации векторной базы данных
+
+Пишет в ./chroma_db напрямую, поэтому запускать его можно только при
+остановленном сервере: Chroma PersistentClient не рассчитан на запись из
+второго процесса. Для запущенного сервера используйте --server URL - база
+будет перестроена самим сервером через /admin/kb/reload (нужен ADMIN_TOKEN).
 """
 
 import sys
 import os
+import time
+import argparse
 sys.path.append(os.path.dirname(__file__))
 
-from agentsystem.parsers import load_and_split_documents
-from agentsystem.chroma_db import create_vectorstore
+import requests
+from dotenv import load_dotenv
+from agentsystem.parsers import load_and_split_documents, load_and_split_sections
+from agentsystem.chroma_db import (
+    create_vectorstore, create_partitioned_vectorstores, set_current_version, new_version,
+    list_versions, list_partition_versions
+)
+
+load_dotenv()
+
+
+def report_stale_versions(versions, version):
+    # Старые версии удаляет сервер при запуске: он знает, какую обслуживает
+    stale = [v for v in versions if v != version]
+    if stale:
+        print(f"ℹ️ Предыдущие версии сохранены: {', '.join(v or '(без версии)' for v in stale)}; "
+              f"сервер удалит их при запуске")
+
+
+def reload_on_server(url, force=False):
+    """Перестраивает базу знаний запущенного сервера и ждет переключения версии"""
+    headers = {"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")}
+    before = requests.get(f"{url}/admin/kb/status", headers=headers, timeout=10)
+    if before.status_code != 200:
+        print(f"❌ Нет доступа к /admin/kb/status (проверьте ADMIN_TOKEN): {before.status_code} {before.text}")
+        return False
+    before = before.json()
+
+    print(f"🔄 Перезагрузка базы знаний на {url}, текущая версия {before.get('version')}...")
+    response = requests.post(f"{url}/admin/kb/reload", params={"force": force}, headers=headers, timeout=10)
+    if response.status_code != 200:
+        print(f"❌ Сервер отклонил перезагрузку: {response.status_code} {response.text}")
+        return False
+
+    while True:
+        time.sleep(1)
+        current = requests.get(f"{url}/admin/kb/status", headers=headers, timeout=10).json()
+        if not current["reloading"] and current.get("last_reload_at") != before.get("last_reload_at"):
+            break
+    if current["last_error"]:
+        print(f"❌ Ошибка перезагрузки, сервер остался на версии {current['version']}: {current['last_error']}")
+        return False
+    print(f"🎉 Сервер переключен на версию {current['version']}")
+    return True
+
 
 def init_vector_database():
     """Инициализирует векторную базу данных"""
     print("🔄 Инициализация векторной базы данных...")
     
     try:
+        if os.getenv("KB_PARTITIONED", "0") == "1":
+            # Отдельная коллекция на каждый раздел базы знаний
+            print("📚 Загружаем документы по разделам...")
+            documents = load_and_split_sections()
+            print(f"✅ Загружено {len(documents)} чанков")
+
+            # Новая версия строится рядом с прежней, сервер загрузит ее при запуске
+            version = new_version()
+            print(f"🔍 Создаем коллекции разделов, версия {version}...")
+            partitions = create_partitioned_vectorstores(documents, version=version)
+            for section in partitions:
+                count = sum(1 for doc in documents if doc.metadata["section"] == section)
+                print(f"   {section}: {count} чанков")
+
+            set_current_version("./chroma_db", version)
+            print("💾 Коллекции разделов сохранены в ./chroma_db")
+
+            report_stale_versions(list_partition_versions("./chroma_db"), version)
+
+            print("\n🎉 Инициализация завершена успешно!")
+            return True
+
         # Загружаем и разбиваем документы
         print("📚 Загружаем документы...")
         documents = load_and_split_documents()
         print(f"✅ Загружено {len(documents)} чанков")
         
-        # Создаем векторное хранилище
-        print("🔍 Создаем векторное хранилище...")
-        vectorstore = create_vectorstore(documents)
+        # Создаем векторное хранилище новой версии рядом с текущей
+        version = new_version()
+        print(f"🔍 Создаем векторное хранилище, версия {version}...")
+        vectorstore = create_vectorstore(documents, version=version)
         print("✅ Векторное хранилище создано")
-        
-        # Сохраняем
-        vectorstore.persist()
+        # Chroma сохраняет коллекцию на диск сама, persist() больше не нужен
+        set_current_version("./chroma_db", version)
         print("💾 Векторное хранилище сохранено в ./chroma_db")
+        report_stale_versions(list_versions("./chroma_db"), version)
         
         print("\n🎉 Инициализация завершена успешно!")
         
@@ -38,5 +111,19 @@ def init_vector_database():
     return True
 
 if __name__ == "__main__":
-    success = init_vector_database()
+    parser = argparse.ArgumentParser(description="Инициализация векторной базы данных")
+    parser.add_argument("--server", default=None,
+                        help="URL запущенного сервера: перестроить базу через /admin/kb/reload")
+    parser.add_argument("--force", action="store_true",
+                        help="С --server: принять базу, заметно меньше текущей")
+    args = parser.parse_args()
+
+    if args.server:
+        try:
+            success = reload_on_server(args.server.rstrip("/"), args.force)
+        except requests.RequestException as e:
+            print(f"❌ Сервер недоступен: {e}")
+            success = False
+    else:
+        success = init_vector_database()
     sys.exit(0 if success else 1)